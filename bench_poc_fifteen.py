@@ -0,0 +1,305 @@
+"""
+Reproducible benchmarks for the Fifteen puzzle solver
+
+Every board size has a fixed-seed set of uniformly random solvable
+instances.  For each set the suite measures solves per second, time
+per move, solution length and peak memory of solve_puzzle, and the
+time spent in each phase as reported by Puzzle.instrument().
+Results are written as JSON and can be compared against a saved
+baseline:
+
+    python bench_poc_fifteen.py --output bench_output.json
+    python bench_poc_fifteen.py --baseline bench_baseline.json
+
+With --scaling the suite instead streams Puzzle.iter_solve on boards
+up to 1000x1000 and reports the setup time, the time per move and the
+peak memory of making and solving a board, and how the time per move
+grows with the board.  A full 1000x1000 solve is billions of moves,
+so only the first --move-budget moves of each board are timed; the
+share of the tiles placed in that prefix is reported as coverage.
+
+With --parallel it times poc_fifteen_search.parallel_ida_star on 4x4
+instances with 1, 2, 4, ... workers up to the number of CPUs and
+reports the speedup over one worker.
+
+The run exits with status 1 when a metric regresses by more than the
+tolerance against the baseline.
+"""
+
+import argparse
+import json
+import sys
+import timeit
+import tracemalloc
+
+import multiprocessing
+
+import poc_fifteen
+import poc_fifteen_search
+
+# (height, width, instances) for the full and the quick suite
+FULL_SIZES = ((3, 3, 200), (4, 4, 200), (5, 5, 100), (10, 10, 20),
+              (20, 20, 5), (50, 50, 2), (100, 100, 1))
+QUICK_SIZES = ((3, 3, 50), (4, 4, 50), (5, 5, 20), (10, 10, 5),
+               (20, 20, 2))
+
+# (height, width) boards for --scaling
+SCALING_SIZES = ((100, 100), (300, 300), (1000, 1000))
+MOVE_BUDGET = 2000000
+
+SEED = 15
+
+# metrics where larger is worse, and the one where smaller is worse
+LOWER_IS_BETTER = ("us_per_move", "mean_moves", "peak_kib")
+HIGHER_IS_BETTER = ("solves_per_sec",)
+
+
+def instances(height, width, count, seed=SEED):
+    """
+    Fixed-seed uniformly random solvable boards, from
+    poc_fifteen.random_puzzles
+    Returns a list of Puzzle objects
+    """
+    return list(poc_fifteen.random_puzzles(
+        height, width, count, "{}:{}x{}".format(seed, height, width)))
+
+
+def bench_size(height, width, count, seed=SEED):
+    """
+    Run all measurements for one board size
+    Returns a dictionary of metrics
+    """
+    boards = instances(height, width, count, seed)
+    # warm up, so once-per-process tables are not timed
+    boards[0].clone().solve_puzzle()
+
+    # throughput and solution length
+    total_moves = 0
+    start = timeit.default_timer()
+    for board in boards:
+        total_moves += len(board.clone().solve_puzzle())
+    elapsed = timeit.default_timer() - start
+
+    # time per phase and call counts, on a separate instrumented pass
+    phase_seconds = {}
+    calls = {}
+    for board in boards:
+        board = board.clone()
+        with board.instrument() as stats:
+            board.solve_puzzle()
+        for name, totals in stats.as_dict()["phases"].items():
+            phase_seconds[name] = phase_seconds.get(name, 0.0) + totals["seconds"]
+        for name, number in stats.calls.items():
+            calls[name] = calls.get(name, 0) + number
+
+    # peak memory of a single solve
+    board = boards[0].clone()
+    tracemalloc.start()
+    board.solve_puzzle()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"height": height,
+            "width": width,
+            "instances": count,
+            "solves_per_sec": count / elapsed,
+            "us_per_move": 1e6 * elapsed / max(total_moves, 1),
+            "mean_moves": float(total_moves) / count,
+            "peak_kib": peak / 1024.0,
+            "phase_ms": dict((name, 1e3 * total / count)
+                             for name, total in phase_seconds.items()),
+            "calls_per_solve": dict((name, float(total) / count)
+                                    for name, total in calls.items())}
+
+
+def _stream(board, move_budget):
+    """
+    Consume the solution of board until at least move_budget moves
+    have been generated
+    Returns (moves, tiles placed)
+    """
+    total_moves = 0
+    chunks = 0
+    for moves in board.iter_solve():
+        total_moves += len(moves)
+        chunks += 1
+        if total_moves >= move_budget:
+            break
+    # the first chunk only moves the zero tile into place
+    return total_moves, max(chunks - 1, 0)
+
+
+def bench_scaling(height, width, move_budget=MOVE_BUDGET, seed=SEED):
+    """
+    Time and memory of making one large board and streaming a prefix
+    of its solution; the Zobrist keys for the size are dropped first
+    so that making them counts as setup
+    Returns a dictionary of metrics
+    """
+    num_cells = height * width
+    poc_fifteen._ZOBRIST_KEYS.pop(num_cells, None)
+    start = timeit.default_timer()
+    board = instances(height, width, 1, seed)[0]
+    setup = timeit.default_timer() - start
+
+    start = timeit.default_timer()
+    total_moves, tiles = _stream(board, move_budget)
+    elapsed = timeit.default_timer() - start
+    del board
+
+    # peak memory of setup plus a streamed solve, traced separately
+    # since tracing slows the solver down
+    poc_fifteen._ZOBRIST_KEYS.pop(num_cells, None)
+    tracemalloc.start()
+    _stream(instances(height, width, 1, seed)[0], min(move_budget, 100000))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"height": height,
+            "width": width,
+            "setup_sec": setup,
+            "moves": total_moves,
+            "coverage": float(tiles) / (num_cells - 1),
+            "us_per_move": 1e6 * elapsed / max(total_moves, 1),
+            "peak_kib": peak / 1024.0,
+            "bytes_per_cell": float(peak) / num_cells}
+
+
+def run_scaling(sizes, move_budget=MOVE_BUDGET, seed=SEED):
+    """
+    Scaling benchmark for each (height, width) in sizes; the time per
+    move of each size is also given relative to the first size
+    Returns a dictionary keyed by "HxW"
+    """
+    results = {}
+    first = None
+    for height, width in sizes:
+        key = "{}x{}".format(height, width)
+        metrics = bench_scaling(height, width, move_budget, seed)
+        if first is None:
+            first = metrics["us_per_move"]
+        metrics["growth"] = metrics["us_per_move"] / first
+        results[key] = metrics
+        print("{:>10}  {setup_sec:7.2f} s setup  {us_per_move:7.3f} us/move"
+              " ({growth:4.2f}x)  {coverage:8.4%} of tiles"
+              "  {peak_kib:10.1f} KiB  {bytes_per_cell:6.1f} B/cell".format(
+                  key, **metrics))
+    return results
+
+
+def bench_parallel(height=4, width=4, count=1, seed=SEED, max_workers=None):
+    """
+    Time optimal solves with the parallel search for a range of
+    worker counts, checking that all of them agree
+    Returns a dictionary keyed by worker count
+    """
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    counts = [1]
+    while counts[-1] * 2 <= max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+
+    boards = instances(height, width, count, seed)
+    results = {}
+    solutions = None
+    for workers in counts:
+        start = timeit.default_timer()
+        moves = [poc_fifteen_search.parallel_ida_star(board, workers=workers)
+                 for board in boards]
+        elapsed = timeit.default_timer() - start
+        assert solutions is None or moves == solutions, "workers disagree"
+        solutions = moves
+        if results:
+            speedup = results["1"]["seconds"] / elapsed
+        else:
+            speedup = 1.0
+        results[str(workers)] = {"seconds": elapsed, "speedup": speedup}
+        print("{:>3} workers  {seconds:8.2f} s  {speedup:5.2f}x".format(
+            workers, **results[str(workers)]))
+    return results
+
+
+def run(sizes, seed=SEED):
+    """
+    Benchmark each (height, width, instances) in sizes
+    Returns a dictionary keyed by "HxW"
+    """
+    results = {}
+    for height, width, count in sizes:
+        key = "{}x{}".format(height, width)
+        results[key] = bench_size(height, width, count, seed)
+        print("{:>8}  {solves_per_sec:10.1f} solves/s  {us_per_move:7.3f} us/move"
+              "  {mean_moves:12.1f} moves  {peak_kib:10.1f} KiB".format(
+                  key, **results[key]))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline run of the same suite
+    Returns a list of regression messages
+    """
+    regressions = []
+    for key, metrics in sorted(results.items()):
+        if key not in baseline:
+            continue
+        for name in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if name not in metrics or name not in baseline[key]:
+                continue
+            old, new = baseline[key][name], metrics[name]
+            if name in LOWER_IS_BETTER:
+                worse = new > old * (1 + tolerance)
+            else:
+                worse = new < old * (1 - tolerance)
+            if worse:
+                regressions.append("{} {}: {:.3f} -> {:.3f}".format(
+                    key, name, old, new))
+    return regressions
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    Returns the process exit status
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true",
+                        help="smaller suite, up to 20x20")
+    parser.add_argument("--scaling", action="store_true",
+                        help="large board scaling run, up to 1000x1000")
+    parser.add_argument("--parallel", action="store_true",
+                        help="parallel IDA* speedup by worker count")
+    parser.add_argument("--move-budget", type=int, default=MOVE_BUDGET,
+                        help="moves streamed per board with --scaling")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--output", default="bench_output.json",
+                        help="where to write the JSON results")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed relative regression (default 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.parallel:
+        results = {"parallel": bench_parallel(seed=args.seed)}
+    elif args.scaling:
+        results = run_scaling(SCALING_SIZES, args.move_budget, args.seed)
+    else:
+        results = run(QUICK_SIZES if args.quick else FULL_SIZES, args.seed)
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file),
+                                  args.tolerance)
+        for message in regressions:
+            print("REGRESSION " + message)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,13 +4,205 @@ Note that solved configuration has the blank (zero) tile in upper left
 Use the arrows key to swap this tile with its neighbors
 """
 
+from array import array
+from contextlib import contextmanager
+
+import multiprocessing
+import random
+import sys
+import timeit
+
+import poc_fifteen_endgame
 import poc_fifteen_gui
+import poc_fifteen_search
+
+
+def _typecode(num_cells):
+    """
+    Smallest array typecode that can hold tile values and cell
+    indices for a board with num_cells cells
+    """
+    if num_cells <= 1 << 8:
+        return "B"
+    if num_cells <= 1 << 16:
+        return "H"
+    return "I"
+
+
+# Zobrist hashing:  the key for tile t on cell c is the low 64 bits of
+# tile_keys[t] * cell_keys[c], which needs O(cells) random numbers
+# rather than a full cells x cells table.  The blank has no key since
+# its position follows from the other tiles.
+_ZOBRIST_MASK = (1 << 64) - 1
+_ZOBRIST_KEYS = {}
+
+
+def _zobrist_keys(num_cells):
+    """
+    Random odd 64-bit tile and cell keys for boards of num_cells
+    cells, generated once per size from a fixed seed; big boards keep
+    them in 8 byte arrays rather than lists of Python integers
+    Returns a tuple of two sequences
+    """
+    if num_cells not in _ZOBRIST_KEYS:
+        rng = random.Random(num_cells)
+        if num_cells > 1 << 16:
+            # filled straight from a generator, never as a list
+            keys = lambda: array("Q", (rng.getrandbits(64) | 1
+                                       for dummy in range(num_cells)))
+        else:
+            keys = lambda: [rng.getrandbits(64) | 1
+                            for dummy in range(num_cells)]
+        tile_keys = keys()
+        tile_keys[0] = 0
+        cell_keys = keys()
+        _ZOBRIST_KEYS[num_cells] = (tile_keys, cell_keys)
+    return _ZOBRIST_KEYS[num_cells]
+
+
+def _tile_bits(num_cells):
+    """
+    Bits per tile in the packed encoding:  4 for boards of up to 16
+    cells (so a 4x4 board fits a 64-bit integer), just enough for the
+    largest tile otherwise
+    """
+    return max(4, (num_cells - 1).bit_length())
+
 
-class Puzzle:
+# _position_tile macros by (zero offset, tile offset, tile in top row),
+# offsets relative to the destination; only short macros are kept so
+# the table stays small on very large boards
+_POSITION_MACROS = {}
+_POSITION_MACRO_CACHE_LEN = 256
+
+
+def _position_macro(zero_offset, tile_offset, top_row):
+    """
+    Moves that bring a tile to its destination, leaving the zero tile
+    just left of it, worked out on coordinates relative to the
+    destination:  zero_offset and tile_offset are (row, col) offsets
+    of the zero tile and the tile, top_row is whether the tile is in
+    row 0 of the board
+    Returns (moves, zero offset, tile offset) with the offsets after
+    the moves, normally (0, -1) and (0, 0)
+    """
+    key = (zero_offset, tile_offset, top_row)
+    if key in _POSITION_MACROS:
+        return _POSITION_MACROS[key]
+
+    zero_row, zero_col = zero_offset
+    tile_row, tile_col = tile_offset
+    moves = []
+
+    # move up to target; coming up from directly below pushes the
+    # tile down a row
+    if zero_row > tile_row:
+        moves.append("u" * (zero_row - tile_row))
+        if zero_col == tile_col:
+            tile_row += 1
+            top_row = False
+        zero_row -= len(moves[-1])
+
+    # move left to target; coming from the right in its row pushes
+    # the tile right a column
+    if zero_col > tile_col:
+        moves.append("l" * (zero_col - tile_col))
+        if zero_row == tile_row:
+            tile_col += 1
+        zero_col -= len(moves[-1])
+
+    # move right to the 1 position left of target if needed
+    if zero_col + 1 < tile_col:
+        moves.append("r" * (tile_col - 1 - zero_col))
+        zero_col = tile_col - 1
+
+    # if target were directly above, we need to
+    # reposition zero to the left
+    if zero_row < tile_row:
+        moves.append("ld")
+        zero_row += 1
+        zero_col -= 1
+
+    assert (tile_col - zero_col) == 1, "zero tile should be 1 left of target"
+
+    # move target left to dest col
+    if tile_col > 0:
+        moves.append(("rdllu" if top_row else "rulld") * tile_col)
+        tile_col = 0
+        zero_col = -1
+
+    # move target right to dest col
+    if tile_col < 0:
+        moves.append(("drrul" if top_row else "urrdl") * -tile_col)
+        tile_col = 0
+        zero_col = -1
+
+    # move target down to dest row
+    if tile_row < 0:
+        moves.append("druld" * -tile_row)
+        tile_row = 0
+        zero_row = 0
+
+    macro = ("".join(moves), (zero_row, zero_col), (tile_row, tile_col))
+    if len(macro[0]) <= _POSITION_MACRO_CACHE_LEN:
+        _POSITION_MACROS[key] = macro
+    return macro
+
+
+class SolveStats(object):
+    """
+    Wall time and move counts per solver phase, and call counts of
+    the hot Puzzle methods, collected while a puzzle is instrumented
+    """
+
+    # methods whose calls are counted
+    COUNTED = ("current_position", "update_puzzle", "_move", "_position_tile")
+
+    def __init__(self):
+        """
+        Start with everything zeroed
+        """
+        # phase name -> [calls, seconds, moves]
+        self.phases = {}
+        self.calls = dict((name, 0) for name in self.COUNTED)
+
+    def record(self, phase, elapsed, moves):
+        """
+        Add one run of a phase
+        """
+        totals = self.phases.setdefault(phase, [0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += elapsed
+        totals[2] += moves
+
+    def as_dict(self):
+        """
+        Returns the counters as a (JSON friendly) dictionary
+        """
+        return {"phases": dict((name, {"calls": calls,
+                                       "seconds": seconds,
+                                       "moves": moves})
+                               for name, (calls, seconds, moves)
+                               in self.phases.items()),
+                "calls": dict(self.calls)}
+
+
+class Puzzle(object):
     """
     Class representation for the Fifteen puzzle
+
+    The board is stored row-major in one flat array of tiles, with a
+    second array mapping each tile value to its flat cell index and a
+    Zobrist hash that is kept up to date move by move, as are counts
+    of the non-zero tiles on their own cell, in total and per row and
+    column, and the first of the solved rows at the bottom, which make
+    the solver invariants cheap to check
     """
 
+    __slots__ = ("_height", "_width", "_cells", "_positions", "_zobrist",
+                 "_correct", "_row_correct", "_col_correct",
+                 "_first_solved_row", "_stats")
+
     def __init__(self, puzzle_height, puzzle_width, initial_grid=None):
         """
         Initialize puzzle with default height and width
@@ -18,14 +210,66 @@ class Puzzle:
         """
         self._height = puzzle_height
         self._width = puzzle_width
-        self._grid = [[col + puzzle_width * row
-                       for col in range(self._width)]
-                      for row in range(self._height)]
+        num_cells = puzzle_height * puzzle_width
+        typecode = _typecode(num_cells)
 
         if initial_grid != None:
-            for row in range(puzzle_height):
-                for col in range(puzzle_width):
-                    self._grid[row][col] = initial_grid[row][col]
+            self._cells = array(typecode,
+                                [initial_grid[row][col]
+                                 for row in range(puzzle_height)
+                                 for col in range(puzzle_width)])
+        else:
+            self._cells = array(typecode, range(num_cells))
+        self._stats = None
+        self._reindex()
+
+    @classmethod
+    def _from_cells(cls, puzzle_height, puzzle_width, cells):
+        """
+        Build a puzzle directly around a flat array of tiles
+        Returns a Puzzle object
+        """
+        puzzle = cls.__new__(cls)
+        puzzle._height = puzzle_height
+        puzzle._width = puzzle_width
+        puzzle._cells = cells
+        puzzle._stats = None
+        puzzle._reindex()
+        return puzzle
+
+    def _reindex(self):
+        """
+        Rebuild the inverse index (tile value -> current flat cell
+        index), the Zobrist hash and the correct tile counts from the
+        tiles
+        """
+        self._positions = array(self._cells.typecode, [0]) * len(self._cells)
+        tile_keys, cell_keys = _zobrist_keys(len(self._cells))
+        zobrist = 0
+        for index, tile in enumerate(self._cells):
+            self._positions[tile] = index
+            zobrist ^= tile_keys[tile] * cell_keys[index]
+        self._zobrist = zobrist & _ZOBRIST_MASK
+
+        width = self._width
+        self._row_correct = [0] * self._height
+        self._col_correct = [0] * width
+        for index in range(1, len(self._cells)):
+            if self._positions[index] == index:
+                self._row_correct[index // width] += 1
+                self._col_correct[index % width] += 1
+        self._correct = sum(self._row_correct)
+        self._find_first_solved_row()
+
+    def _find_first_solved_row(self):
+        """
+        Recount the rows at the bottom (leaving out row 0, which holds
+        the zero tile's cell) that are full of their own tiles
+        """
+        row = self._height
+        while row > 1 and self._row_correct[row - 1] == self._width:
+            row -= 1
+        self._first_solved_row = row
 
     def __str__(self):
         """
@@ -34,10 +278,103 @@ class Puzzle:
         """
         ans = ""
         for row in range(self._height):
-            ans += str(self._grid[row])
+            start = row * self._width
+            ans += str(list(self._cells[start:start + self._width]))
             ans += "\n"
         return ans
 
+    def __eq__(self, other):
+        """
+        Puzzles are equal when they have the same shape and tiles
+        """
+        if not isinstance(other, Puzzle):
+            return NotImplemented
+        return (self._height == other._height and
+                self._width == other._width and
+                self._cells == other._cells)
+
+    def __ne__(self, other):
+        """
+        Inverse of __eq__
+        """
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        """
+        Hash of the current board; changes as the puzzle is updated
+        """
+        return self._zobrist
+
+    def get_zobrist(self):
+        """
+        Zobrist hash of the current board, maintained incrementally
+        so it costs nothing to read after each move
+        Returns a 64-bit integer
+        """
+        return self._zobrist
+
+    def encode(self):
+        """
+        Pack the tiles into one integer, row-major from the lowest
+        bits, using _tile_bits() bits per tile
+        Returns an integer
+        """
+        bits = _tile_bits(len(self._cells))
+        if bits == 8 * self._cells.itemsize:
+            # the tiles are already packed, one per array item
+            cells = self._cells
+            if sys.byteorder != "little":
+                cells = cells[:]
+                cells.byteswap()
+            return int.from_bytes(cells.tobytes(), "little")
+        # pack through a byte buffer, since shifting one growing
+        # integer tile by tile costs O(cells ** 2)
+        data = bytearray()
+        buffered = 0
+        filled = 0
+        for tile in self._cells:
+            buffered |= tile << filled
+            filled += bits
+            while filled >= 8:
+                data.append(buffered & 0xff)
+                buffered >>= 8
+                filled -= 8
+        if filled:
+            data.append(buffered)
+        return int.from_bytes(bytes(data), "little")
+
+    @classmethod
+    def decode(cls, puzzle_height, puzzle_width, key):
+        """
+        Inverse of encode
+        Returns a Puzzle object
+        """
+        num_cells = puzzle_height * puzzle_width
+        bits = _tile_bits(num_cells)
+        cells = array(_typecode(num_cells))
+        if bits == 8 * cells.itemsize:
+            cells.frombytes(key.to_bytes(num_cells * cells.itemsize, "little"))
+            if sys.byteorder != "little":
+                cells.byteswap()
+        else:
+            data = key.to_bytes((num_cells * bits + 7) // 8, "little")
+            mask = (1 << bits) - 1
+            buffered = 0
+            filled = 0
+            index = 0
+            for dummy in range(num_cells):
+                while filled < bits:
+                    buffered |= data[index] << filled
+                    index += 1
+                    filled += 8
+                cells.append(buffered & mask)
+                buffered >>= bits
+                filled -= bits
+        return cls._from_cells(puzzle_height, puzzle_width, cells)
+
     #####################################
     # GUI methods
 
@@ -60,22 +397,97 @@ class Puzzle:
         Getter for the number at tile position pos
         Returns an integer
         """
-        return self._grid[row][col]
+        return self._cells[row * self._width + col]
 
     def set_number(self, row, col, value):
         """
         Setter for the number at tile position pos
         """
-        self._grid[row][col] = value
+        index = row * self._width + col
+        tile_keys, cell_keys = _zobrist_keys(len(self._cells))
+        self._zobrist ^= (tile_keys[self._cells[index]] * cell_keys[index] ^
+                          tile_keys[value] * cell_keys[index]) & _ZOBRIST_MASK
+        if index:
+            change = (value == index) - (self._cells[index] == index)
+            self._correct += change
+            self._row_correct[row] += change
+            self._col_correct[col] += change
+            if change:
+                self._find_first_solved_row()
+        self._cells[index] = value
+        self._positions[value] = index
 
     def clone(self):
         """
         Make a copy of the puzzle to update during solving
         Returns a Puzzle object
         """
-        new_puzzle = Puzzle(self._height, self._width, self._grid)
+        new_puzzle = Puzzle.__new__(Puzzle)
+        new_puzzle._height = self._height
+        new_puzzle._width = self._width
+        new_puzzle._cells = self._cells[:]
+        new_puzzle._positions = self._positions[:]
+        new_puzzle._zobrist = self._zobrist
+        new_puzzle._correct = self._correct
+        new_puzzle._row_correct = self._row_correct[:]
+        new_puzzle._col_correct = self._col_correct[:]
+        new_puzzle._first_solved_row = self._first_solved_row
+        new_puzzle._stats = None
         return new_puzzle
 
+    def transposed(self):
+        """
+        Mirror the board in its main diagonal, renumbering the tiles
+        so that the solved board maps to the solved board; a move
+        string for the result solves this puzzle once u/l and d/r are
+        swapped (see TRANSPOSED_MOVES)
+        Returns a Puzzle object
+        """
+        height, width = self._height, self._width
+        relabel = [(tile % width) * height + tile // width
+                   for tile in range(height * width)]
+        cells = array(self._cells.typecode)
+        for col in range(width):
+            cells.extend(map(relabel.__getitem__, self._cells[col::width]))
+        return Puzzle._from_cells(width, height, cells)
+
+    ########################################################
+    # Instrumentation
+
+    @contextmanager
+    def instrument(self):
+        """
+        Collect a SolveStats for everything done to this puzzle inside
+        the with block; uninstrumented puzzles only pay for a None check
+        in the hot methods
+
+            with puzzle.instrument() as stats:
+                puzzle.solve_puzzle()
+            report(stats.as_dict())
+        """
+        previous = self._stats
+        self._stats = SolveStats()
+        try:
+            yield self._stats
+        finally:
+            self._stats = previous
+
+    def _phase(self, name, method, *args):
+        """
+        Call method(*args), recording its wall time and the length of
+        its move string (if it returns one) under phase name when the
+        puzzle is instrumented
+        Returns the result of the call
+        """
+        stats = self._stats
+        if stats is None:
+            return method(*args)
+        start = timeit.default_timer()
+        result = method(*args)
+        stats.record(name, timeit.default_timer() - start,
+                     len(result) if isinstance(result, str) else 0)
+        return result
+
     ########################################################
     # Core puzzle methods
 
@@ -85,42 +497,121 @@ class Puzzle:
         position (solved_row, solved_col) when the puzzle is solved
         Returns a tuple of two integers        
         """
+        if self._stats is not None:
+            self._stats.calls["current_position"] += 1
         solved_value = (solved_col + self._width * solved_row)
-
-        for row in range(self._height):
-            for col in range(self._width):
-                if self._grid[row][col] == solved_value:
-                    return (row, col)
-        assert False, "Value " + str(solved_value) + " not found"
+        return divmod(self._positions[solved_value], self._width)
 
     def update_puzzle(self, move_string):
         """
         Updates the puzzle state based on the provided move string
         """
+        if self._stats is not None:
+            self._stats.calls["update_puzzle"] += 1
+        width = self._width
+        cells = self._cells
+        positions = self._positions
+        tile_keys, cell_keys = _zobrist_keys(len(cells))
+        zobrist = self._zobrist
+        row_correct = self._row_correct
+        col_correct = self._col_correct
+        correct = self._correct
+        first_solved = self._first_solved_row
+        zero = positions[0]
+        zero_row, zero_col = divmod(zero, width)
+        # bad moves raise explicitly, so that python -O cannot let one
+        # through to the swap below
+        try:
+            for direction in move_string:
+                if direction == "l":
+                    if zero_col == 0:
+                        raise AssertionError("move off grid: " + direction)
+                    other = zero - 1
+                    zero_col -= 1
+                elif direction == "r":
+                    if zero_col == width - 1:
+                        raise AssertionError("move off grid: " + direction)
+                    other = zero + 1
+                    zero_col += 1
+                elif direction == "u":
+                    if zero_row == 0:
+                        raise AssertionError("move off grid: " + direction)
+                    other = zero - width
+                    zero_row -= 1
+                elif direction == "d":
+                    if zero_row == self._height - 1:
+                        raise AssertionError("move off grid: " + direction)
+                    other = zero + width
+                    zero_row += 1
+                else:
+                    raise AssertionError("invalid direction: " + direction)
+                tile = cells[other]
+                # only the tile that slides can leave or reach its cell
+                if tile == other:
+                    correct -= 1
+                    row_correct[zero_row] -= 1
+                    col_correct[zero_col] -= 1
+                    if zero_row >= first_solved:
+                        first_solved = zero_row + 1
+                elif tile == zero:
+                    correct += 1
+                    row = zero // width
+                    row_correct[row] += 1
+                    col_correct[zero % width] += 1
+                    # a row completed just above the solved rows joins
+                    # them, along with any full rows above it
+                    while (row == first_solved - 1 and row > 0 and
+                           row_correct[row] == width):
+                        first_solved = row
+                        row -= 1
+                cells[zero] = tile
+                positions[tile] = zero
+                key = tile_keys[tile]
+                zobrist ^= key * cell_keys[zero] ^ key * cell_keys[other]
+                zero = other
+        finally:
+            # the zero tile, hash and totals are written back once,
+            # even when a bad move stops the update part way through
+            cells[zero] = 0
+            positions[0] = zero
+            self._zobrist = zobrist & _ZOBRIST_MASK
+            self._correct = correct
+            self._first_solved_row = first_solved
+
+    def is_solvable(self):
+        """
+        Check whether the solved configuration can be reached
+
+        Every move swaps the zero tile with a neighbour, flipping both
+        the parity of the board as a permutation and the parity of the
+        zero tile's distance from the upper left, so the two parities
+        must agree.  The permutation parity is found from its cycles
+        in a single pass, which stays cheap on very large boards
+        Returns a boolean
+        """
+        cells = self._cells
+        seen = bytearray(len(cells))
+        transpositions = 0
+        for start in range(len(cells)):
+            if seen[start]:
+                continue
+            length = 0
+            index = start
+            while not seen[index]:
+                seen[index] = 1
+                index = cells[index]
+                length += 1
+            transpositions += length - 1
+
         zero_row, zero_col = self.current_position(0, 0)
-        for direction in move_string:
-            if direction == "l":
-                assert zero_col > 0, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row][zero_col - 1]
-                self._grid[zero_row][zero_col - 1] = 0
-                zero_col -= 1
-            elif direction == "r":
-                assert zero_col < self._width - 1, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row][zero_col + 1]
-                self._grid[zero_row][zero_col + 1] = 0
-                zero_col += 1
-            elif direction == "u":
-                assert zero_row > 0, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row - 1][zero_col]
-                self._grid[zero_row - 1][zero_col] = 0
-                zero_row -= 1
-            elif direction == "d":
-                assert zero_row < self._height - 1, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row + 1][zero_col]
-                self._grid[zero_row + 1][zero_col] = 0
-                zero_row += 1
-            else:
-                assert False, "invalid direction: " + direction
+        return transpositions % 2 == (zero_row + zero_col) % 2
+
+    def _check_solvable(self):
+        """
+        Reject unsolvable puzzles before any solving work is done
+        """
+        if not self.is_solvable():
+            raise ValueError("unsolvable puzzle:\n{}".format(self))
 
     ##################################################################
     # Phase one methods
@@ -133,12 +624,24 @@ class Puzzle:
         puzzle.n_by_m_check(puzzle.get_height() - 1, 
                             puzzle.get_width() - 1)
         
+        The whole board, full rows or full columns are answered from
+        the correct tile counts
         """
-        positions = [(row, col) for row in range(nrows) for col in range(mcols)]
-        for pos in positions:
-            if not self._correct_position(*pos):
+        if nrows <= 0 or mcols <= 0:
+            return True
+        # the zero tile's cell is counted separately
+        zero_home = self._positions[0] == 0
+        if nrows >= self._height and mcols >= self._width:
+            return self._correct + zero_home == len(self._cells)
+        if mcols >= self._width:
+            return (sum(self._row_correct[:nrows]) + zero_home ==
+                    nrows * self._width)
+        if nrows >= self._height:
+            return (sum(self._col_correct[:mcols]) + zero_home ==
+                    mcols * self._height)
+        for row in range(nrows):
+            if not self._row_tail_correct(row, 0, mcols):
                 return False
-    
         return True
 
 
@@ -167,6 +670,23 @@ class Puzzle:
         """
         return self.get_number(row, col) == row*self.get_width() + col
 
+    def _row_tail_correct(self, row, start_col, end_col):
+        """
+        Check whether row holds its own tiles from start_col up to
+        (not including) end_col, comparing the slice in one go
+        """
+        start = row * self._width
+        cells = self._cells[start + start_col:start + end_col]
+        return cells == array(cells.typecode,
+                              range(start + start_col, start + end_col))
+
+    def _rows_correct_below(self, target_row):
+        """
+        Check whether every row below target_row is solved, from the
+        first of the solved rows at the bottom
+        """
+        return self._first_solved_row <= target_row + 1
+
     def lower_row_invariant(self, target_row, target_col):
         """
         Check whether the puzzle satisfies the specified invariant
@@ -177,17 +697,12 @@ class Puzzle:
             return False
 
         # check rows below
-        for row in range(target_row + 1, self.get_height()):
-            for col in range(self.get_width()):
-                if not self._correct_position(row, col):
-                    return False
+        if not self._rows_correct_below(target_row):
+            return False
 
         # now check cols to the right 
-        for col in range(target_col + 1, self.get_width()):
-            if not self._correct_position(target_row, col):
-                return False
-
-        return True 
+        return self._row_tail_correct(target_row, target_col + 1,
+                                      self.get_width())
 
     def _move(self, move_string, target_position):
         """
@@ -195,9 +710,11 @@ class Puzzle:
         the tile positions and all_moves string locals
         to the outer function
         """
+        if self._stats is not None:
+            self._stats.calls["_move"] += 1
         self.update_puzzle(move_string)
-        # finding the new zero and target tile positions 
-        # could be sped up, but keep it simple for now
+        # tile positions come from the inverse index, so these
+        # lookups are constant time
         czt = self.current_position(0, 0)
         ctt = self.current_position(*target_position)
         return czt, ctt
@@ -241,67 +758,21 @@ class Puzzle:
         the destination position (id'd by dest_row, dest_col) leaving
         the zero tile in position (dest_row, dest_col - 1)
         """
+        if self._stats is not None:
+            self._stats.calls["_position_tile"] += 1
 
         # czt:  current zero tile position 
         czt = self.current_position(0, 0)
-        # target_tile: target tile id's by target_row, target_col
-        target_tile = (target_row, target_col)
-        # dtt:  destination target tile position
-        dtt = (dest_row, dest_col)
         # ctt:  current target tile position 
         ctt = self.current_position(target_row, target_col)
-       
-        all_moves = ""
-
-        # move up to target
-        while czt[0] > ctt[0]:
-            czt, ctt = self._move("u", target_tile)
-            all_moves += "u"
-
-        # move left to target
-        while czt[1] > ctt[1]:
-            czt, ctt = self._move("l", target_tile)
-            all_moves += "l"
-
-        # move right to the 1 position left of target if needed
-        while czt[1] + 1 < ctt[1]:
-            czt, ctt = self._move("r", target_tile)
-            all_moves += "r"
-
-
-        # if target were directly above, we need to 
-        # reposition zero to the left
-        if czt[0] < ctt[0]:
-            czt, ctt = self._move("ld", target_tile)
-            all_moves += "ld"
-
-        assert (ctt[1] - czt[1]) == 1, "zero tile should be 1 left of target"
-
-        # move target left to dest col
-        while ctt[1] > dtt[1]:
-            # case 1:  we're in top row
-            if ctt[0] == 0:
-                czt, ctt = self._move("rdllu", target_tile)
-                all_moves += "rdllu"
-            else:
-                czt, ctt = self._move("rulld", target_tile)
-                all_moves += "rulld"
-
-        # move target right to dest col
-        while ctt[1] < dtt[1]:
-            # case 1:  we're in top row
-            if ctt[0] == 0:
-                czt, ctt = self._move("drrul", target_tile)
-                all_moves += "drrul"
-            else:
-                czt, ctt = self._move("urrdl", target_tile)
-                all_moves += "urrdl"
-
-        # move target down to dest row 
-        while ctt[0] < dtt[0]:
-            czt, ctt = self._move("druld", target_tile)
-            all_moves += "druld"
 
+        # the whole move sequence comes from one (cached) macro lookup
+        # and is applied to the board in a single update
+        all_moves, dummy_czt, dummy_ctt = _position_macro(
+            (czt[0] - dest_row, czt[1] - dest_col),
+            (ctt[0] - dest_row, ctt[1] - dest_col),
+            ctt[0] == 0)
+        self.update_puzzle(all_moves)
         return all_moves
 
     def solve_interior_tile(self, target_row, target_col):
@@ -358,11 +829,15 @@ class Puzzle:
         check whether tiles either below or to the right of 
         the target are in their correct positions
         """
-        for row in range(self.get_height()):
-            for col in range(self.get_width()):
-                if row > target_row or col > target_col:
-                    if not self._correct_position(row, col):
-                        return False
+        if not self._rows_correct_below(target_row):
+            return False
+
+        # a column right of the target has no zero tile cell, so it is
+        # all correct exactly when its count is the board height
+        height = self.get_height()
+        for col in range(target_col + 1, self.get_width()):
+            if self._col_correct[col] != height:
+                return False
 
         return True
  
@@ -466,42 +941,550 @@ class Puzzle:
         # assert self.two_by_two_check(), "unsolvable 2x2"
         return moves
 
-    def solve_puzzle(self):
+    def solve_endgame(self, rows, cols):
+        """
+        Solve the upper left rows x cols part of the puzzle (2x3 or
+        3x3) along a shortest path, using an exact distance table
+        (see poc_fifteen_endgame.distance_table)
+        Updates the puzzle and returns a move string
+        """
+        moves = poc_fifteen_endgame.solve_region(self, rows, cols)
+        self.update_puzzle(moves)
+        return moves
+
+    def solve_puzzle(self, optimize=False):
         """
         Generate a solution string for a puzzle
+        With optimize, moves that immediately undo each other are
+        removed (see optimize_moves) and the shorter string is checked
+        against the board
+        On very large boards prefer iter_solve, since the whole
+        solution string is held here
         Updates the puzzle and returns a move string
         """
-        # start by moving zero down to lower right
-        moves = self._move_zero_to_target(self.get_height() - 1, 
-                                          self.get_width() - 1)
+        if optimize:
+            self._check_solvable()
+            start = self.clone()
+            moves = self._phase("optimize_moves", optimize_moves,
+                                self.solve_puzzle())
+            start.update_puzzle(moves)
+            # checked even under python -O, like the solver invariants
+            if start != self:
+                raise AssertionError("optimized moves do not solve the "
+                                     "puzzle:\n{}".format(start))
+            return moves
+
+        return "".join(self.iter_solve())
+
+    def iter_solve(self):
+        """
+        Solve the puzzle a tile (or phase) at a time
+        The puzzle is checked for solvability straight away, and is
+        updated as the solution is consumed
+
+        The invariant checks after each tile cost O(width) from the
+        correct tile counts, so the total cost is proportional to the
+        number of moves on every board.
+
+        On boards over 65536 cells a puzzle takes 8 bytes per cell
+        (tiles and position index), the Zobrist keys shared by every
+        board of that size 16 more, and the solvability check 1 byte
+        of scratch; with one chunk of moves, O(height + width) long,
+        that is a peak of about 25MB for a 1000x1000 board made by
+        random_puzzle (Puzzle(h, w, grid) also needs the grid)
+        Returns a generator of move strings that together solve the
+        puzzle
+        """
+        self._check_solvable()
+        return self._solve_chunks()
 
-        # now solve each row below 1 from bottom up
-        for row in range(self.get_height() - 1, 1, -1):
+    def _check_invariant(self, method, *args):
+        """
+        Run an invariant check, timed as phase "invariants"; unlike an
+        assert it still runs under python -O
+        """
+        if not self._phase("invariants", method, *args):
+            raise AssertionError("{}{} failed\npuzzle:\n{}".format(
+                method.__name__, args, self))
+
+    def _solve_chunks(self):
+        """
+        Generator behind iter_solve: yields the moves of each phase
+        step as soon as it is done and its invariant checked
+        """
+        # the upper left corner is finished from an exact distance
+        # table: 3x3 on boards three wide, 2x3 on other boards at
+        # least three wide, and the 2x2 macros otherwise
+        if self.get_width() == 3 and self.get_height() >= 3:
+            endgame_rows = 3
+        else:
+            endgame_rows = 2
+        endgame_cols = min(self.get_width(), 3)
+        # a table covering the whole board finishes it from anywhere
+        whole_board = (self.get_width() == 3 and
+                       self.get_height() == endgame_rows)
+
+        # otherwise start by moving zero down to lower right
+        if not whole_board:
+            yield self._phase("move_zero", self._move_zero_to_target,
+                              self.get_height() - 1, self.get_width() - 1)
+
+        # now solve each row below the endgame from bottom up
+        for row in range(self.get_height() - 1, endgame_rows - 1, -1):
             for col in range(self.get_width() - 1, 0, -1):
-                moves += self.solve_interior_tile(row, col)
-                assert self.lower_row_invariant(row, col - 1),\
-                   "row: {}\npuzzle:\n{}".format(row, self)
+                moves = self._phase("solve_interior_tile",
+                                    self.solve_interior_tile, row, col)
+                self._check_invariant(self.lower_row_invariant, row, col - 1)
+                yield moves
 
-            moves += self.solve_col0_tile(row)
+            moves = self._phase("solve_col0_tile", self.solve_col0_tile, row)
             # ensure the current row has been solved
-            assert self.lower_row_invariant(row - 1, self.get_width() - 1),\
-                   "row: {}\npuzzle:\n{}".format(row, self)
+            self._check_invariant(self.lower_row_invariant,
+                                  row - 1, self.get_width() - 1)
+            yield moves
+
+        if endgame_rows == 2 and not whole_board:
+            # ensure that all rows below 1 are solved
+            self._check_invariant(self.row1_invariant, self.get_width() - 1)
+            # solve rows 1 and 0 from right to left up to the endgame
+            for col in range(self.get_width() - 1, endgame_cols - 1, -1):
+                moves = self._phase("solve_row1_tile",
+                                    self.solve_row1_tile, col)
+                self._check_invariant(self.row0_invariant, col)
+                yield moves
+                moves = self._phase("solve_row0_tile",
+                                    self.solve_row0_tile, col)
+                self._check_invariant(self.row1_invariant, col - 1)
+                yield moves
+
+        # finally solve the upper left corner
+        if endgame_cols == 3:
+            moves = self._phase("solve_endgame", self.solve_endgame,
+                                endgame_rows, endgame_cols)
+        else:
+            moves = self._phase("solve_2x2", self.solve_2x2)
+        self._check_invariant(self.nrow_by_mcol_check,
+                              self.get_height(), self.get_width())
+        yield moves
+
+    ###########################################################
+    # Optimal solver
 
-        # ensure that all rows below 1 are solved
-        assert self.row1_invariant(self.get_width() - 1)
-        # solve row 1 from right to left stopping at col 1
-        for col in range(self.get_width() - 1, 1, -1):
-            moves += self.solve_row1_tile(col)
-            assert self.row0_invariant(col)
-            moves += self.solve_row0_tile(col)
-            assert self.row1_invariant(col - 1)
+    def solve_oriented(self, optimize=False):
+        """
+        Generate a solution string with the phase solver run on both
+        the board and its transpose, which clears columns instead of
+        rows, keeping the shorter one (reflections do not keep the zero
+        tile's corner, so they are not tried)
+        Without optimize the transposed run is abandoned as soon as it
+        is no shorter; with optimize both runs go through
+        optimize_moves in full and the shorter optimized one is kept
+        Updates the puzzle and returns a move string
+        """
+        self._check_solvable()
+        candidates = [self.clone().solve_puzzle()]
+        # raw lengths only bound the result when nothing is cancelled
+        limit = None if optimize else len(candidates[0])
+        length = 0
+        chunks = []
+        for chunk in self.transposed().iter_solve():
+            length += len(chunk)
+            if limit is not None and length >= limit:
+                break
+            chunks.append(chunk)
+        else:
+            candidates.append("".join(map(TRANSPOSED_MOVES.get,
+                                          "".join(chunks))))
+        if optimize:
+            candidates = [self._phase("optimize_moves", optimize_moves, moves)
+                          for moves in candidates]
+        moves = min(candidates, key=len)
+        self.update_puzzle(moves)
+        return moves
 
-        # finally solve the 2x2
-        moves += self.solve_2x2()
+    def solve_optimal(self, heuristic=None, stats=None):
+        """
+        Generate a shortest solution string with IDA* search
+        (practical for boards up to 4x4)
+        heuristic defaults to Manhattan distance plus linear conflicts,
+        stats may be a poc_fifteen_search.SearchStats to fill in
+        Updates the puzzle and returns a move string
+        """
+        moves = poc_fifteen_search.ida_star(self, heuristic, stats)
+        self.update_puzzle(moves)
+        return moves
 
+    def solve_anytime(self, deadline_ms=100, max_nodes=500000, stats=None):
+        """
+        Generate the best solution string found within deadline_ms
+        milliseconds and max_nodes stored states, starting from the
+        optimized phase solution (see poc_fifteen_search.anytime_search)
+        stats may be a poc_fifteen_search.AnytimeStats, which reports
+        the lower bound and the gap to it
+        Updates the puzzle and returns a move string
+        """
+        moves = poc_fifteen_search.anytime_search(self, deadline_ms, max_nodes,
+                                                  stats=stats)
+        self.update_puzzle(moves)
         return moves
 
 
+##################################################################
+# Move strings
+
+INVERSE_MOVES = {"u": "d", "d": "u", "l": "r", "r": "l"}
+
+# moves on a transposed board, as moves on the original
+TRANSPOSED_MOVES = {"u": "l", "d": "r", "l": "u", "r": "d"}
+
+
+def optimize_moves(move_string):
+    """
+    Shorten a move string by cancelling every move that is
+    immediately undone, including pairs that only become adjacent
+    once the moves between them cancel (e.g. "ruld" + "urdl")
+    The shortened string leaves any board in the same state
+    Returns a move string
+    """
+    kept = []
+    for direction in move_string:
+        if kept and kept[-1] == INVERSE_MOVES[direction]:
+            kept.pop()
+        else:
+            kept.append(direction)
+    return "".join(kept)
+
+
+def first_invalid_move(puzzle_height, puzzle_width, zero_position, move_string):
+    """
+    Check a move string for a board of the given shape with the zero
+    tile at zero_position, a (row, col) tuple, by following only the
+    zero tile; no board is touched
+    Returns the index of the first move that is off the grid or not
+    one of "udlr", or -1 when every move is legal
+    """
+    zero_row, zero_col = zero_position
+    last_row = puzzle_height - 1
+    last_col = puzzle_width - 1
+    for index, direction in enumerate(move_string):
+        if direction == "l" and zero_col > 0:
+            zero_col -= 1
+        elif direction == "r" and zero_col < last_col:
+            zero_col += 1
+        elif direction == "u" and zero_row > 0:
+            zero_row -= 1
+        elif direction == "d" and zero_row < last_row:
+            zero_row += 1
+        else:
+            return index
+    return -1
+
+
+def first_invalid_moves(puzzle_height, puzzle_width, zero_positions,
+                        move_strings, zero_position=None):
+    """
+    first_invalid_move for many move strings, each with its own
+    zero tile position; pass zero_positions=None and a single
+    zero_position to share one position among all of them
+    Returns a list of indices, -1 for strings that are legal
+    """
+    if zero_position is not None:
+        assert zero_positions is None, "give zero_positions or zero_position"
+        zero_positions = [zero_position] * len(move_strings)
+    return [first_invalid_move(puzzle_height, puzzle_width, position, moves)
+            for position, moves in zip(zero_positions, move_strings)]
+
+
+class MovePermutation(object):
+    """
+    A move string compiled, for one starting position of the zero
+    tile, into the cell permutation it performs:  after the moves,
+    cell c holds the tile that was on cell source[c].  Applying it
+    costs O(cells) however long the string was, and permutations
+    that follow on from each other compose into one
+    """
+
+    __slots__ = ("_height", "_width", "_start", "_end", "_source", "_length")
+
+    def __init__(self, puzzle_height, puzzle_width, start, end, source, length):
+        """
+        Wrap a permutation taking the zero tile from flat cell start
+        to flat cell end in length moves
+        """
+        self._height = puzzle_height
+        self._width = puzzle_width
+        self._start = start
+        self._end = end
+        self._source = source
+        self._length = length
+
+    @classmethod
+    def compile(cls, puzzle_height, puzzle_width, zero_position, move_string):
+        """
+        Compile a move string for the zero tile starting at
+        zero_position, a (row, col) tuple; every move is checked here
+        so that applying needs no checks, and a move off the grid
+        raises ValueError
+        Returns a MovePermutation
+        """
+        num_cells = puzzle_height * puzzle_width
+        source = array(_typecode(num_cells), range(num_cells))
+        zero_row, zero_col = zero_position
+        assert 0 <= zero_row < puzzle_height and 0 <= zero_col < puzzle_width
+        zero = zero_row * puzzle_width + zero_col
+        start = zero
+        for index, direction in enumerate(move_string):
+            if direction == "l" and zero_col > 0:
+                other = zero - 1
+                zero_col -= 1
+            elif direction == "r" and zero_col < puzzle_width - 1:
+                other = zero + 1
+                zero_col += 1
+            elif direction == "u" and zero_row > 0:
+                other = zero - puzzle_width
+                zero_row -= 1
+            elif direction == "d" and zero_row < puzzle_height - 1:
+                other = zero + puzzle_width
+                zero_row += 1
+            else:
+                raise ValueError("move {} off grid or invalid: {}".format(
+                    index, direction))
+            source[zero], source[other] = source[other], source[zero]
+            zero = other
+        return cls(puzzle_height, puzzle_width, start, zero, source,
+                   len(move_string))
+
+    def get_start(self):
+        """
+        Returns the (row, col) the zero tile has to start from
+        """
+        return divmod(self._start, self._width)
+
+    def get_end(self):
+        """
+        Returns the (row, col) the zero tile ends up on
+        """
+        return divmod(self._end, self._width)
+
+    def __len__(self):
+        """
+        Number of moves compiled into the permutation
+        """
+        return self._length
+
+    def __eq__(self, other):
+        """
+        Permutations are equal when they move every tile the same way
+        from the same start
+        """
+        return (isinstance(other, MovePermutation) and
+                (self._height, self._width, self._start) ==
+                (other._height, other._width, other._start) and
+                self._source == other._source)
+
+    def __ne__(self, other):
+        """
+        Inverse of __eq__
+        """
+        return not self == other
+
+    def then(self, other):
+        """
+        The permutation doing self, then other, which has to start
+        where self leaves the zero tile
+        Returns a MovePermutation
+        """
+        if (other._height, other._width, other._start) != \
+           (self._height, self._width, self._end):
+            raise ValueError("permutations do not follow on")
+        first = self._source
+        source = array(first.typecode, map(first.__getitem__, other._source))
+        return MovePermutation(self._height, self._width, self._start,
+                               other._end, source, self._length + other._length)
+
+    def inverse(self):
+        """
+        The permutation that undoes this one
+        Returns a MovePermutation
+        """
+        source = array(self._source.typecode, self._source)
+        for cell, origin in enumerate(self._source):
+            source[origin] = cell
+        return MovePermutation(self._height, self._width, self._end,
+                               self._start, source, self._length)
+
+    def apply(self, puzzle):
+        """
+        Update the puzzle as the compiled moves would, in O(cells);
+        the puzzle must have this shape and its zero tile on the start
+        cell, otherwise ValueError is raised
+        """
+        if (puzzle.get_height(), puzzle.get_width()) != \
+           (self._height, self._width):
+            raise ValueError("permutation is for a {}x{} board".format(
+                self._height, self._width))
+        if puzzle._positions[0] != self._start:
+            raise ValueError("zero tile is not on {}".format(self.get_start()))
+        cells = puzzle._cells
+        puzzle._cells = array(cells.typecode,
+                              map(cells.__getitem__, self._source))
+        puzzle._reindex()
+
+
+def compile_moves(puzzle, move_string):
+    """
+    Compile a move string for the puzzle's shape and current zero
+    tile position
+    Returns a MovePermutation
+    """
+    return MovePermutation.compile(puzzle.get_height(), puzzle.get_width(),
+                                   puzzle.current_position(0, 0), move_string)
+
+
+# solver entry points by name, for batch and service callers
+SOLVE_MODES = {"phase": Puzzle.solve_puzzle,
+               "phase_optimized": lambda puzzle: puzzle.solve_puzzle(True),
+               "optimal": Puzzle.solve_optimal,
+               "anytime": Puzzle.solve_anytime,
+               "oriented": lambda puzzle: puzzle.solve_oriented(True)}
+
+
+##################################################################
+# Random instances
+#
+# A Fisher-Yates shuffle of the tiles is uniform over all boards; its
+# permutation parity comes for free from the number of real swaps.
+# Unsolvable boards then have two non-zero tiles swapped, at cells
+# chosen only from the position of the zero tile.  That swap pairs
+# every unsolvable board with exactly one solvable one, so the result
+# is uniform over the solvable boards.
+
+
+def random_cells(puzzle_height, puzzle_width, rng=random):
+    """
+    Tiles of a uniformly random solvable board, drawn from rng
+    (anything with a random() method, such as random.Random)
+    Returns a flat array as held by Puzzle
+    """
+    assert puzzle_height >= 2 and puzzle_width >= 2, "board too small"
+    num_cells = puzzle_height * puzzle_width
+    cells = array(_typecode(num_cells), range(num_cells))
+    draw = rng.random
+    parity = 0
+    for index in range(num_cells - 1, 0, -1):
+        other = int(draw() * (index + 1))
+        if other != index:
+            cells[index], cells[other] = cells[other], cells[index]
+            parity ^= 1
+
+    zero_row, zero_col = divmod(cells.index(0), puzzle_width)
+    if parity != (zero_row + zero_col) % 2:
+        first = 0 if cells[0] and cells[1] else num_cells - 2
+        cells[first], cells[first + 1] = cells[first + 1], cells[first]
+    return cells
+
+
+def random_puzzle(puzzle_height, puzzle_width, rng=random):
+    """
+    Uniformly random solvable puzzle, see random_cells
+    Returns a Puzzle object
+    """
+    return Puzzle._from_cells(puzzle_height, puzzle_width,
+                              random_cells(puzzle_height, puzzle_width, rng))
+
+
+def random_puzzles(puzzle_height, puzzle_width, count=None, seed=None):
+    """
+    Stream of independent uniformly random solvable puzzles, the same
+    stream for the same seed; endless when count is None
+    Returns a generator of Puzzle objects
+    """
+    rng = random.Random(seed)
+    number = 0
+    while count is None or number < count:
+        yield random_puzzle(puzzle_height, puzzle_width, rng)
+        number += 1
+
+
+##################################################################
+# Batch solving
+
+
+def _pack_board(board):
+    """
+    Encode a Puzzle or a grid (list of rows) as shape plus raw tiles
+    so that it crosses process boundaries as a few bytes
+    Returns a tuple (height, width, typecode, bytes)
+    """
+    if isinstance(board, Puzzle):
+        cells = board._cells
+        height, width = board.get_height(), board.get_width()
+    else:
+        height, width = len(board), len(board[0])
+        cells = array(_typecode(height * width),
+                      [tile for row in board for tile in row])
+    return height, width, cells.typecode, cells.tobytes()
+
+
+def _unpack_board(packed):
+    """
+    Inverse of _pack_board
+    Returns a Puzzle object
+    """
+    height, width, typecode, data = packed
+    cells = array(typecode)
+    cells.frombytes(data)
+    return Puzzle._from_cells(height, width, cells)
+
+
+def _pack_solvable(index, board):
+    """
+    Pack a board for solve_many, rejecting it first if unsolvable
+    Returns a tuple as from _pack_board
+    """
+    packed = _pack_board(board)
+    if not _unpack_board(packed).is_solvable():
+        raise ValueError("board {} is unsolvable".format(index))
+    return packed
+
+
+def _solve_packed(task):
+    """
+    Worker side of solve_many:  solve one packed board
+    Returns (index, moves) with the moves as ASCII bytes
+    """
+    index, mode, packed = task
+    puzzle = _unpack_board(packed)
+    return index, SOLVE_MODES[mode](puzzle).encode("ascii")
+
+
+def solve_many(boards, workers=None, chunksize=16, mode="phase"):
+    """
+    Solve many boards (Puzzle objects or grids) on a pool of worker
+    processes, workers defaulting to the number of CPUs
+    Boards go to the workers chunksize at a time and are not updated
+    An unsolvable board raises ValueError as soon as it is reached
+    Yields (index, moves) for each board as soon as it is solved,
+    so results arrive out of order
+    """
+    tasks = ((index, mode, _pack_solvable(index, board))
+             for index, board in enumerate(boards))
+    if workers == 1:
+        for task in tasks:
+            index, moves = _solve_packed(task)
+            yield index, moves.decode("ascii")
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for index, moves in pool.imap_unordered(_solve_packed, tasks,
+                                                chunksize):
+            yield index, moves.decode("ascii")
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 # Start interactive simulation
 # poc_fifteen_gui.FifteenGUI(Puzzle(2, 3))
 
@@ -0,0 +1,147 @@
+"""
+Solution cache for the Fifteen puzzle
+
+Solutions are kept by board shape, solver mode (a key of
+poc_fifteen.SOLVE_MODES) and the packed tiles from Puzzle.encode.
+Recently used solutions stay in memory up to a byte limit, least
+recently used first out.  With a path, every solution is also written
+to a sqlite file, so the cache survives restarts and can be shared by
+processes on one machine.
+"""
+
+from collections import OrderedDict
+import sqlite3
+
+import poc_fifteen
+
+_SCHEMA = ("CREATE TABLE IF NOT EXISTS solutions "
+           "(key TEXT PRIMARY KEY, moves TEXT NOT NULL)")
+
+
+class SolutionCache(object):
+    """
+    Least recently used cache of move strings, optionally backed by
+    a sqlite file
+    """
+
+    def __init__(self, max_bytes=64 << 20, path=None):
+        """
+        Keep up to about max_bytes of keys and moves in memory, and
+        everything in the sqlite file at path if given
+        """
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            self._db.execute(_SCHEMA)
+            self._db.commit()
+
+    @staticmethod
+    def key(puzzle, mode="phase"):
+        """
+        Canonical cache key of a board and solver mode
+        Returns a string
+        """
+        return "{}x{}:{}:{:x}".format(puzzle.get_height(), puzzle.get_width(),
+                                      mode, puzzle.encode())
+
+    def __len__(self):
+        """
+        Number of solutions held in memory
+        """
+        return len(self._entries)
+
+    def _remember(self, key, moves):
+        """
+        Put a solution in memory as the most recently used one,
+        evicting old ones to stay under the byte limit
+        """
+        if key in self._entries:
+            self._bytes -= len(key) + len(self._entries.pop(key))
+        size = len(key) + len(moves)
+        if size > self._max_bytes:
+            return
+        self._entries[key] = moves
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            old_key, old_moves = self._entries.popitem(last=False)
+            self._bytes -= len(old_key) + len(old_moves)
+
+    def get(self, puzzle, mode="phase"):
+        """
+        Look up the solution of a board without changing it
+        Returns a move string, or None when it is not cached
+        """
+        key = self.key(puzzle, mode)
+        moves = self._entries.get(key)
+        if moves is not None:
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return moves
+        if self._db is not None:
+            row = self._db.execute("SELECT moves FROM solutions WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is not None:
+                self._remember(key, row[0])
+                self._hits += 1
+                self._disk_hits += 1
+                return row[0]
+        self._misses += 1
+        return None
+
+    def put(self, puzzle, mode, moves):
+        """
+        Store the solution of a board, as it was before solving
+        """
+        key = self.key(puzzle, mode)
+        self._remember(key, moves)
+        if self._db is not None:
+            self._db.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?)",
+                             (key, moves))
+            self._db.commit()
+
+    def solve(self, puzzle, mode="phase"):
+        """
+        Solve the puzzle like poc_fifteen.SOLVE_MODES[mode], reusing a
+        cached solution when there is one
+        Updates the puzzle and returns a move string
+        """
+        moves = self.get(puzzle, mode)
+        if moves is not None:
+            puzzle.update_puzzle(moves)
+            return moves
+        start = puzzle.clone()
+        moves = poc_fifteen.SOLVE_MODES[mode](puzzle)
+        self.put(start, mode, moves)
+        return moves
+
+    def get_stats(self):
+        """
+        Returns the hit and miss counters and memory use as a dictionary
+        """
+        return {"hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes}
+
+    def clear(self):
+        """
+        Drop the in-memory entries; the sqlite file is kept
+        """
+        self._entries.clear()
+        self._bytes = 0
+
+    def close(self):
+        """
+        Close the sqlite file, if any
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,96 @@
+"""
+Exact endgame tables for the Fifteen puzzle
+
+When only the upper left 2x3 or 3x3 part of a board is left to solve,
+a table holding the exact distance to the goal of every arrangement
+of that region (at most 9!/2 = 181,440 reachable ones) gives a
+shortest finish:  from each arrangement, step to a neighbour one move
+closer.  The tables are pattern databases over all the region's
+tiles, saved under TABLE_DIR and mapped from there, so processes share
+one copy; a table is only built when its file is missing.
+"""
+
+import os
+
+import poc_fifteen_pdb
+import poc_fifteen_search
+
+# where the table files are kept, $POC_FIFTEEN_TABLES if set
+TABLE_DIR = (os.environ.get("POC_FIFTEEN_TABLES") or
+             os.path.join(os.path.expanduser("~"), ".cache", "poc_fifteen"))
+
+_TABLES = {}
+
+
+def table_path(rows, cols):
+    """
+    Returns the file name of the rows x cols table under TABLE_DIR
+    """
+    return os.path.join(TABLE_DIR, "endgame_{}x{}.bin".format(rows, cols))
+
+
+def distance_table(rows, cols):
+    """
+    Exact distance table for a rows x cols region, mapped from its
+    file the first time it is asked for.  A missing file is built and
+    written first (to a temporary name, so other processes never map a
+    partial file); if it cannot be written the table stays in memory
+    Returns a poc_fifteen_pdb.PatternDatabase
+    """
+    if (rows, cols) in _TABLES:
+        return _TABLES[(rows, cols)]
+    path = table_path(rows, cols)
+    if not os.path.exists(path):
+        database = poc_fifteen_pdb.PatternDatabase.build(
+            rows, cols, range(1, rows * cols))
+        partial = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(TABLE_DIR, exist_ok=True)
+            database.save(partial)
+            os.replace(partial, path)
+        except OSError:
+            _TABLES[(rows, cols)] = database
+            return database
+    _TABLES[(rows, cols)] = poc_fifteen_pdb.PatternDatabase.load(path)
+    return _TABLES[(rows, cols)]
+
+
+def solve_region(puzzle, rows, cols):
+    """
+    Find a shortest move string that solves the upper left rows x
+    cols region of the puzzle, which must already hold its own tiles
+    and the zero tile; the rest of the board is not touched
+    The puzzle itself is not changed
+    Returns a move string
+    """
+    width = puzzle.get_width()
+    # region cell of each region tile, tiles numbered within the region
+    cells = [0] * (rows * cols)
+    for row in range(rows):
+        for col in range(cols):
+            tile_row, tile_col = divmod(puzzle.get_number(row, col), width)
+            assert tile_row < rows and tile_col < cols, \
+                "tile from outside the region at ({}, {})".format(row, col)
+            cells[tile_row * cols + tile_col] = row * cols + col
+
+    table = distance_table(rows, cols)
+    blank = cells[0]
+    tile_cells = cells[1:]
+    distance = table.lookup(tile_cells)
+    assert distance != poc_fifteen_pdb.UNREACHED, "unsolvable region"
+
+    neighbours = poc_fifteen_search.neighbour_table(rows, cols)
+    moves = []
+    while distance:
+        for direction, other in neighbours[blank]:
+            slot = tile_cells.index(other)
+            tile_cells[slot] = blank
+            if table.lookup(tile_cells) == distance - 1:
+                break
+            tile_cells[slot] = other
+        else:
+            assert False, "no move closer to the goal"
+        moves.append(direction)
+        blank = other
+        distance -= 1
+    return "".join(moves)
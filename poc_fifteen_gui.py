@@ -2,11 +2,19 @@
 GUI for the Fifteen puzzle
 """
 
+import queue
+import threading
+
 import simpleguitk as simplegui
 
+import poc_fifteen
+
 # constants
 TILE_SIZE = 60
 
+# row and column step of the zero tile for each move
+MOVE_STEPS = {"u": (-1, 0), "d": (1, 0), "l": (0, -1), "r": (0, 1)}
+
 
 class FifteenGUI:
     """
@@ -26,9 +34,17 @@ class FifteenGUI:
                                              self._puzzle_height * TILE_SIZE)
         self._solution = ""
         self._current_moves = ""
+        self._init_draw_cache()
+        # background solve:  move chunks from the worker thread, and
+        # the event that asks it to stop
+        self._chunks = None
+        self._cancel = None
+        self._solved_moves = 0
         self._frame.add_button("Solve", self.solve, 100)
+        self._frame.add_button("Cancel", self.cancel, 100)
         self._frame.add_input("Enter moves", self.enter_moves, 100)
         self._frame.add_button("Print moves", self.print_moves, 100)
+        self._progress = self._frame.add_label("")
         self._frame.set_draw_handler(self.draw)
         self._frame.set_keydown_handler(self.keydown)
         self._timer = simplegui.create_timer(250, self.tick)
@@ -39,84 +55,225 @@ class FifteenGUI:
         """
         Timer for incrementally displaying computed solution
         """
+        self._collect_solution()
         if self._solution == "":
             return
         direction = self._solution[0]
         self._solution = self._solution[1:]
         try:
-            self._puzzle.update_puzzle(direction)
+            self._apply(direction)
         except:
-            print "invalid move:", direction
+            print("invalid move:", direction)
 
     def solve(self):
         """
         Event handler to generate solution string for given configuration
+        The solve runs on a worker thread and its moves are played as
+        they arrive, so the frame keeps responding meanwhile
         """
-        new_puzzle = self._puzzle.clone()
-        self._solution = new_puzzle.solve_puzzle()
+        self.cancel()
+        self._chunks = queue.Queue()
+        self._cancel = threading.Event()
+        self._solved_moves = 0
+        self._progress.set_text("Solving...")
+        worker = threading.Thread(target=solve_worker,
+                                  args=(self._puzzle.clone(), self._chunks,
+                                        self._cancel))
+        worker.daemon = True
+        worker.start()
+
+    def cancel(self):
+        """
+        Event handler to stop a running solve and its animation
+        """
+        if self._cancel is not None:
+            self._cancel.set()
+        # the worker may be done while its moves are still playing
+        if self._chunks is not None or self._solution:
+            self._progress.set_text("Cancelled")
+        self._chunks = None
+        self._cancel = None
+        self._solution = ""
+
+    def _collect_solution(self):
+        """
+        Move the chunks the worker has produced so far into the
+        animation queue and update the progress label
+        """
+        if self._chunks is None:
+            return
+        chunks = []
+        finished = None
+        while finished is None:
+            try:
+                chunk = self._chunks.get_nowait()
+            except queue.Empty:
+                break
+            if chunk is None:
+                finished = "Solved: {} moves"
+            elif isinstance(chunk, Exception):
+                detail = str(chunk).split("\n")[0].rstrip(":")
+                finished = "Cannot solve: " + detail
+            else:
+                chunks.append(chunk)
+        self._solution += "".join(chunks)
+        self._solved_moves += sum(len(chunk) for chunk in chunks)
+        if finished is not None:
+            self._progress.set_text(finished.format(self._solved_moves))
+            self._chunks = None
+            self._cancel = None
+        else:
+            self._progress.set_text("Solving: {} moves, {} to play".format(
+                self._solved_moves, len(self._solution)))
 
     def print_moves(self):
         """
         Event handler to print and reset current move string
         """
-        print self._current_moves
+        print(self._current_moves)
         self._current_moves = ""
 
     def enter_moves(self, txt):
         """
         Event handler to enter move string
+        The whole string is checked before anything is played
         """
+        index = poc_fifteen.first_invalid_move(
+            self._puzzle_height, self._puzzle_width,
+            self._puzzle.current_position(0, 0), txt)
+        if index >= 0:
+            print("invalid move at {}: {}".format(index, txt))
+            return
+        self.cancel()
         self._solution = txt
 
     def keydown(self, key):
         """
         Keydown handler that allows updates of puzzle using arrow keys
+        A manual move cancels any solve, whose plan would no longer fit
         """
+        if key in [simplegui.KEY_MAP[name]
+                   for name in ("up", "down", "left", "right")]:
+            self.cancel()
         if key == simplegui.KEY_MAP["up"]:
             try:
-                self._puzzle.update_puzzle("u")
+                self._apply("u")
                 self._current_moves += "u"
             except:
-                print "invalid move: up"
+                print("invalid move: up")
         elif key == simplegui.KEY_MAP["down"]:
             try:
-                self._puzzle.update_puzzle("d")
+                self._apply("d")
                 self._current_moves += "d"
             except:
-                print "invalid move: down"
+                print("invalid move: down")
         elif key == simplegui.KEY_MAP["left"]:
             try:
-                self._puzzle.update_puzzle("l")
+                self._apply("l")
                 self._current_moves += "l"
             except:
-                print "invalid move: left"
+                print("invalid move: left")
         elif key == simplegui.KEY_MAP["right"]:
             try:
-                self._puzzle.update_puzzle("r")
+                self._apply("r")
                 self._current_moves += "r"
             except:
-                print "invalid move: right"
+                print("invalid move: right")
 
-    def draw(self, canvas):
+    def _init_draw_cache(self):
         """
-        Draw the puzzle
+        Work out the polygon and label position of every cell once,
+        and the label of every tile, then fill in the draw list
         """
+        self._labels = [str(tile_num) for tile_num in
+                        range(self._puzzle_height * self._puzzle_width)]
+        # per cell:  [polygon, background, label, label position]
+        self._cell_draws = []
         for row in range(self._puzzle_height):
             for col in range(self._puzzle_width):
-                tile_num = self._puzzle.get_number(row, col)
-                if tile_num == 0:
-                    background = "Red"
-                else:
-                    background = "Blue"
                 tile = [[col * TILE_SIZE, row * TILE_SIZE],
                         [(col + 1) * TILE_SIZE, row * TILE_SIZE],
                         [(col + 1) * TILE_SIZE, (row + 1) * TILE_SIZE],
                         [col * TILE_SIZE, (row + 1) * TILE_SIZE]]
-                canvas.draw_polygon(tile, 1, "White", background)
-                canvas.draw_text(str(tile_num),
-                                 [(col + .2) * TILE_SIZE,
-                                  (row + 0.8) * TILE_SIZE],
-                                 2 *  TILE_SIZE // 3, "White")
+                self._cell_draws.append([tile, None, None,
+                                         [(col + .2) * TILE_SIZE,
+                                          (row + 0.8) * TILE_SIZE]])
+        self._dirty = set()
+        self._refresh_all()
+
+    def _refresh_cell(self, row, col):
+        """
+        Bring the draw list entry of one cell up to date
+        """
+        tile_num = self._puzzle.get_number(row, col)
+        entry = self._cell_draws[row * self._puzzle_width + col]
+        if tile_num == 0:
+            entry[1] = "Red"
+        else:
+            entry[1] = "Blue"
+        entry[2] = self._labels[tile_num]
 
+    def _refresh_all(self):
+        """
+        Bring the whole draw list up to date
+        """
+        for row in range(self._puzzle_height):
+            for col in range(self._puzzle_width):
+                self._refresh_cell(row, col)
+        self._drawn_hash = self._puzzle.get_zobrist()
 
+    def _apply(self, moves):
+        """
+        Update the puzzle, marking the cells the zero tile passes
+        through for redrawing; only those cells can have changed
+        """
+        row, col = self._puzzle.current_position(0, 0)
+        self._dirty.add((row, col))
+        try:
+            self._puzzle.update_puzzle(moves)
+        finally:
+            # cells past an invalid move are off the grid or unchanged
+            for direction in moves:
+                row_step, col_step = MOVE_STEPS.get(direction, (0, 0))
+                row, col = row + row_step, col + col_step
+                if (0 <= row < self._puzzle_height and
+                        0 <= col < self._puzzle_width):
+                    self._dirty.add((row, col))
 
+    def draw(self, canvas):
+        """
+        Draw the puzzle
+        Only the cells changed since the last frame are worked out
+        again; the canvas is cleared every frame, so every cell is
+        still handed to it from the draw list
+        """
+        if self._dirty:
+            for row, col in self._dirty:
+                self._refresh_cell(row, col)
+            self._dirty.clear()
+            self._drawn_hash = self._puzzle.get_zobrist()
+        elif self._puzzle.get_zobrist() != self._drawn_hash:
+            # changed behind the GUI's back
+            self._refresh_all()
+
+        font_size = 2 * TILE_SIZE // 3
+        for tile, background, label, position in self._cell_draws:
+            canvas.draw_polygon(tile, 1, "White", background)
+            canvas.draw_text(label, position, font_size, "White")
+
+
+def solve_worker(puzzle, chunks, cancel):
+    """
+    Solve puzzle a chunk of moves at a time, putting each chunk on the
+    chunks queue until done (then None) or cancel is set; a failure
+    is put on the queue instead
+    """
+    try:
+        for moves in puzzle.iter_solve():
+            if cancel.is_set():
+                return
+            chunks.put(moves)
+    except Exception as error:
+        chunks.put(error)
+        return
+    chunks.put(None)
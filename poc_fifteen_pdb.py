@@ -0,0 +1,326 @@
+"""
+Additive disjoint pattern databases for the Fifteen puzzle
+
+A pattern database stores, for every placement of a group of tiles,
+the number of moves of those tiles needed to bring them home, with
+the blank allowed to roam freely over the other tiles.  When the
+groups are disjoint, the moves counted by each database are
+different moves, so the values can be added for an admissible
+heuristic.  The blank goes to the upper left, as in Puzzle.
+
+Tables are built by breadth first search from the goal, saved as
+compact binary files and loaded back with mmap so that processes
+reading the same file share a single copy.
+"""
+
+import mmap
+import struct
+import sys
+
+# contiguous 5-5-5 and 6-6-3 partitions of the 4x4 board
+PATTERNS_4X4_555 = ((1, 2, 3, 6, 7),
+                    (4, 5, 8, 9, 12),
+                    (10, 11, 13, 14, 15))
+PATTERNS_4X4_663 = ((1, 2, 3, 5, 6, 7),
+                    (4, 8, 9, 12, 13, 14),
+                    (10, 11, 15))
+
+# file header:  magic, height, width, pattern size
+_MAGIC = b"P15PDB1\0"
+_HEADER = struct.Struct("<8sHHH")
+_TILE = struct.Struct("<H")
+
+UNREACHED = 255
+
+
+def table_size(num_cells, pattern_size):
+    """
+    Number of ways to place pattern_size distinct tiles on num_cells
+    Returns an integer
+    """
+    size = 1
+    for cell in range(num_cells - pattern_size + 1, num_cells + 1):
+        size *= cell
+    return size
+
+
+def rank(cells, num_cells):
+    """
+    Dense index of a placement of distinct tiles, given as the cell
+    of each pattern tile in pattern order
+    Returns an integer in range(table_size(num_cells, len(cells)))
+    """
+    index = 0
+    used = 0
+    for depth, cell in enumerate(cells):
+        smaller = bin(used & ((1 << cell) - 1)).count("1")
+        index = index * (num_cells - depth) + cell - smaller
+        used |= 1 << cell
+    return index
+
+
+def _neighbour_masks(height, width):
+    """
+    Bitmask of the cells adjacent to each flat cell index
+    """
+    masks = []
+    for row in range(height):
+        for col in range(width):
+            index = row * width + col
+            mask = 0
+            if row > 0:
+                mask |= 1 << (index - width)
+            if row < height - 1:
+                mask |= 1 << (index + width)
+            if col > 0:
+                mask |= 1 << (index - 1)
+            if col < width - 1:
+                mask |= 1 << (index + 1)
+            masks.append(mask)
+    return masks
+
+
+def _blank_region(start, free, neighbour_masks):
+    """
+    Bitmask of the free cells the blank can reach from start
+    without moving a pattern tile
+    """
+    region = 1 << start
+    frontier = region
+    while frontier:
+        grow = 0
+        while frontier:
+            low = frontier & -frontier
+            grow |= neighbour_masks[low.bit_length() - 1]
+            frontier ^= low
+        frontier = grow & free & ~region
+        region |= frontier
+    return region
+
+
+def build_table(height, width, pattern):
+    """
+    Breadth first search over placements of the pattern tiles,
+    counting only moves of pattern tiles
+    Returns a bytearray indexed by rank()
+    """
+    num_cells = height * width
+    full = (1 << num_cells) - 1
+    neighbour_masks = _neighbour_masks(height, width)
+    table = bytearray([UNREACHED]) * table_size(num_cells, len(pattern))
+    # one visited flag per (placement, blank region); a region is
+    # named by its lowest cell
+    visited = bytearray(len(table) * num_cells)
+
+    start = tuple(pattern)
+    occupied = sum(1 << cell for cell in start)
+    region = _blank_region(0, full & ~occupied, neighbour_masks)
+    index = rank(start, num_cells)
+    table[index] = 0
+    visited[index * num_cells + (region & -region).bit_length() - 1] = 1
+
+    frontier = [(start, occupied, region)]
+    depth = 0
+    while frontier:
+        depth += 1
+        assert depth < UNREACHED, "pattern too large for byte entries"
+        next_frontier = []
+        for cells, occupied, region in frontier:
+            for slot, cell in enumerate(cells):
+                # slide a pattern tile into a neighbouring blank
+                targets = neighbour_masks[cell] & region
+                while targets:
+                    low = targets & -targets
+                    targets ^= low
+                    new_cells = cells[:slot] + (low.bit_length() - 1,) + cells[slot + 1:]
+                    new_occupied = occupied ^ (1 << cell) ^ low
+                    new_region = _blank_region(cell, full & ~new_occupied,
+                                               neighbour_masks)
+                    index = rank(new_cells, num_cells)
+                    key = index * num_cells + (new_region & -new_region).bit_length() - 1
+                    if visited[key]:
+                        continue
+                    visited[key] = 1
+                    if table[index] == UNREACHED:
+                        table[index] = depth
+                    next_frontier.append((new_cells, new_occupied, new_region))
+        frontier = next_frontier
+    return table
+
+
+class PatternDatabase(object):
+    """
+    Move counts for one group of tiles, held in memory or mapped
+    read-only from a file
+    """
+
+    def __init__(self, height, width, pattern, table):
+        """
+        Wrap a table built for the given board shape and pattern
+        """
+        assert 0 not in pattern, "the blank cannot be a pattern tile"
+        assert len(table) == table_size(height * width, len(pattern))
+        self._height = height
+        self._width = width
+        self._pattern = tuple(pattern)
+        self._table = table
+        self._mmap = None
+        self._path = None
+
+    @classmethod
+    def build(cls, height, width, pattern):
+        """
+        Build the database for the pattern tiles
+        Returns a PatternDatabase
+        """
+        return cls(height, width, pattern, build_table(height, width, pattern))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map a database file written by save() into memory
+        Returns a PatternDatabase
+        """
+        with open(path, "rb") as table_file:
+            mapped = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, height, width, pattern_size = _HEADER.unpack_from(mapped, 0)
+        assert magic == _MAGIC, "not a pattern database: " + path
+        offset = _HEADER.size
+        pattern = []
+        for dummy in range(pattern_size):
+            pattern.append(_TILE.unpack_from(mapped, offset)[0])
+            offset += _TILE.size
+        database = cls(height, width, pattern, memoryview(mapped)[offset:])
+        database._mmap = mapped
+        database._path = path
+        return database
+
+    def __reduce__(self):
+        """
+        Pickle a mapped database as its file name, so that worker
+        processes map the same file again instead of receiving (or
+        failing to receive) a copy of the table
+        """
+        if self._mmap is not None:
+            return (PatternDatabase.load, (self._path,))
+        return (PatternDatabase, (self._height, self._width, self._pattern,
+                                  self._table))
+
+    def save(self, path):
+        """
+        Write the database as a header followed by one byte per entry
+        """
+        with open(path, "wb") as table_file:
+            table_file.write(_HEADER.pack(_MAGIC, self._height, self._width,
+                                          len(self._pattern)))
+            for tile in self._pattern:
+                table_file.write(_TILE.pack(tile))
+            table_file.write(self._table)
+
+    def close(self):
+        """
+        Release the file mapping, if any
+        """
+        if self._mmap is not None:
+            self._table.release()
+            self._mmap.close()
+            self._mmap = None
+
+    def get_pattern(self):
+        """
+        Returns the tuple of pattern tiles
+        """
+        return self._pattern
+
+    def get_shape(self):
+        """
+        Returns the board (height, width) the database was built for
+        """
+        return self._height, self._width
+
+    def lookup(self, cells):
+        """
+        Moves needed for pattern tiles at the given cells, in
+        pattern order
+        Returns an integer
+        """
+        return self._table[rank(cells, self._height * self._width)]
+
+
+class PatternDatabaseHeuristic(object):
+    """
+    Sum of a set of disjoint pattern databases, usable wherever a
+    poc_fifteen_search heuristic is expected
+    """
+
+    def __init__(self, databases):
+        """
+        Combine databases built for the same board over disjoint tiles
+        """
+        self._databases = list(databases)
+        assert self._databases, "need at least one database"
+        shape = self._databases[0].get_shape()
+        # tile -> (database number, slot in its pattern)
+        self._owner = {}
+        for number, database in enumerate(self._databases):
+            assert database.get_shape() == shape, "mixed board shapes"
+            for slot, tile in enumerate(database.get_pattern()):
+                assert tile not in self._owner, "patterns overlap"
+                self._owner[tile] = (number, slot)
+
+    def _pattern_cells(self, tiles, number):
+        """
+        Cells of the tiles of one database, in pattern order
+        """
+        return [tiles.index(tile)
+                for tile in self._databases[number].get_pattern()]
+
+    def estimate(self, tiles):
+        """
+        Returns the heuristic value of the whole board
+        """
+        return sum(database.lookup(self._pattern_cells(tiles, number))
+                   for number, database in enumerate(self._databases))
+
+    def delta(self, tiles, tile, src, dst):
+        """
+        Returns the change in estimate after tile moved from src to dst
+        Only the database holding that tile is consulted
+        """
+        if tile not in self._owner:
+            return 0
+        number, slot = self._owner[tile]
+        database = self._databases[number]
+        cells = self._pattern_cells(tiles, number)
+        after = database.lookup(cells)
+        cells[slot] = src
+        return after - database.lookup(cells)
+
+
+def build_and_save(height, width, patterns, path_format):
+    """
+    Build a database per pattern and save each one to
+    path_format.format(number)
+    Returns a list of the file names
+    """
+    paths = []
+    for number, pattern in enumerate(patterns):
+        path = path_format.format(number)
+        PatternDatabase.build(height, width, pattern).save(path)
+        paths.append(path)
+    return paths
+
+
+def load_heuristic(paths):
+    """
+    Map the database files and combine them
+    Returns a PatternDatabaseHeuristic
+    """
+    return PatternDatabaseHeuristic(PatternDatabase.load(path)
+                                    for path in paths)
+
+
+# Build the 4x4 5-5-5 tables, for example:
+#   python poc_fifteen_pdb.py pdb_4x4_555_{}.bin
+if __name__ == "__main__":
+    print(build_and_save(4, 4, PATTERNS_4X4_555, sys.argv[1]))
@@ -0,0 +1,626 @@
+"""
+Search based solvers for the Fifteen puzzle
+Solutions use the same move alphabet as Puzzle.update_puzzle
+(moves of the zero tile) and the same goal, zero in upper left
+"""
+
+import heapq
+import multiprocessing
+import timeit
+
+# move of the zero tile that undoes each move
+INVERSE_MOVES = {"u": "d", "d": "u", "l": "r", "r": "l", None: None}
+
+FOUND = -1
+# a parallel subsearch given up because an earlier one succeeded
+ABORTED = -2
+
+
+class SearchStats(object):
+    """
+    Counters filled in by a search
+    """
+
+    def __init__(self):
+        """
+        Start with everything zeroed
+        """
+        self.nodes = 0
+        self.iterations = 0
+        self.bound = 0
+        self.elapsed = 0.0
+
+    def __str__(self):
+        """
+        Generate string representation for the stats
+        Returns a string
+        """
+        return "{} nodes, {} iterations, bound {}, {:.3f}s".format(
+            self.nodes, self.iterations, self.bound, self.elapsed)
+
+    def as_dict(self):
+        """
+        Returns the counters as a dictionary
+        """
+        return {"nodes": self.nodes,
+                "iterations": self.iterations,
+                "bound": self.bound,
+                "elapsed": self.elapsed}
+
+
+class AnytimeStats(SearchStats):
+    """
+    SearchStats for anytime_search, which also records the proven
+    lower bound and the length of the solution returned
+    """
+
+    def __init__(self):
+        """
+        Start with everything zeroed
+        """
+        SearchStats.__init__(self)
+        self.lower_bound = 0
+        self.solution_length = 0
+        self.improvements = 0
+
+    def __str__(self):
+        """
+        Generate string representation for the stats
+        Returns a string
+        """
+        return "{} moves, lower bound {}, {} improvements, {}".format(
+            self.solution_length, self.lower_bound, self.improvements,
+            SearchStats.__str__(self))
+
+    def get_gap(self):
+        """
+        Returns how many moves the solution may be longer than optimal
+        """
+        return self.solution_length - self.lower_bound
+
+    def as_dict(self):
+        """
+        Returns the counters as a dictionary
+        """
+        counters = SearchStats.as_dict(self)
+        counters.update({"lower_bound": self.lower_bound,
+                         "solution_length": self.solution_length,
+                         "improvements": self.improvements,
+                         "gap": self.get_gap()})
+        return counters
+
+
+def board_tiles(puzzle):
+    """
+    Returns the tiles of the puzzle as a flat row-major list
+    """
+    return [puzzle.get_number(row, col)
+            for row in range(puzzle.get_height())
+            for col in range(puzzle.get_width())]
+
+
+def neighbour_table(height, width):
+    """
+    For each flat cell index, the (direction, cell) pairs the zero
+    tile can move to from there, in "udlr" order
+    Returns a list of lists
+    """
+    table = []
+    for row in range(height):
+        for col in range(width):
+            index = row * width + col
+            moves = []
+            if row > 0:
+                moves.append(("u", index - width))
+            if row < height - 1:
+                moves.append(("d", index + width))
+            if col > 0:
+                moves.append(("l", index - 1))
+            if col < width - 1:
+                moves.append(("r", index + 1))
+            table.append(moves)
+    return table
+
+
+#####################################
+# Heuristics
+#
+# A heuristic estimates the number of moves left on a flat tile
+# list.  estimate() evaluates a whole board, delta() returns the
+# change after one tile has slid from cell src to cell dst (the
+# tiles passed in already show the move)
+
+
+class ManhattanHeuristic(object):
+    """
+    Sum of the Manhattan distances of each tile from its goal cell
+    """
+
+    def __init__(self, height, width):
+        """
+        Precompute the distance of every tile from every cell
+        """
+        self._height = height
+        self._width = width
+        num_cells = height * width
+        self._distance = [[0] * num_cells for dummy in range(num_cells)]
+        for tile in range(1, num_cells):
+            goal_row, goal_col = divmod(tile, width)
+            for cell in range(num_cells):
+                row, col = divmod(cell, width)
+                self._distance[tile][cell] = (abs(row - goal_row) +
+                                              abs(col - goal_col))
+
+    def estimate(self, tiles):
+        """
+        Returns the heuristic value of the whole board
+        """
+        distance = self._distance
+        return sum(distance[tile][cell] for cell, tile in enumerate(tiles))
+
+    def delta(self, tiles, tile, src, dst):
+        """
+        Returns the change in estimate after tile moved from src to dst
+        """
+        distance = self._distance[tile]
+        return distance[dst] - distance[src]
+
+
+def _line_conflicts(goal_order):
+    """
+    Minimum number of tiles that have to leave a line so that the
+    remaining goal positions are in increasing order, that is the
+    line length less its longest increasing subsequence
+    """
+    if len(goal_order) < 2:
+        return 0
+    tails = []
+    for value in goal_order:
+        low, high = 0, len(tails)
+        while low < high:
+            mid = (low + high) // 2
+            if tails[mid] < value:
+                low = mid + 1
+            else:
+                high = mid
+        if low == len(tails):
+            tails.append(value)
+        else:
+            tails[low] = value
+    return len(goal_order) - len(tails)
+
+
+class LinearConflictHeuristic(ManhattanHeuristic):
+    """
+    Manhattan distance plus two moves for every tile that has to step
+    out of its goal row or column to let other tiles in that line pass
+    """
+
+    def _row_conflicts(self, tiles, row):
+        """
+        Conflicts among the tiles in row that belong to that row
+        """
+        width = self._width
+        start = row * width
+        return _line_conflicts([tile for tile in tiles[start:start + width]
+                                if tile and tile // width == row])
+
+    def _col_conflicts(self, tiles, col):
+        """
+        Conflicts among the tiles in col that belong to that column
+        """
+        width = self._width
+        return _line_conflicts([tile for tile in tiles[col::width]
+                                if tile and tile % width == col])
+
+    def estimate(self, tiles):
+        """
+        Returns the heuristic value of the whole board
+        """
+        conflicts = 0
+        for row in range(self._height):
+            conflicts += self._row_conflicts(tiles, row)
+        for col in range(self._width):
+            conflicts += self._col_conflicts(tiles, col)
+        return ManhattanHeuristic.estimate(self, tiles) + 2 * conflicts
+
+    def delta(self, tiles, tile, src, dst):
+        """
+        Returns the change in estimate after tile moved from src to dst
+        Only the two lines the tile left and entered are rescored
+        """
+        width = self._width
+        distance = self._distance[tile]
+        src_row, src_col = divmod(src, width)
+        dst_row, dst_col = divmod(dst, width)
+        if src_row == dst_row:
+            line_conflicts = self._col_conflicts
+            lines = (src_col, dst_col)
+        else:
+            line_conflicts = self._row_conflicts
+            lines = (src_row, dst_row)
+
+        after = line_conflicts(tiles, lines[0]) + line_conflicts(tiles, lines[1])
+        tiles[src], tiles[dst] = tile, 0
+        before = line_conflicts(tiles, lines[0]) + line_conflicts(tiles, lines[1])
+        tiles[src], tiles[dst] = 0, tile
+        return distance[dst] - distance[src] + 2 * (after - before)
+
+
+#####################################
+# IDA*
+
+
+def _depth_first(tiles, neighbours, delta, path, counter, abort=None):
+    """
+    Bounded depth first search over tiles, moved in place, with the
+    moves taken so far kept in path and the nodes visited counted in
+    counter[0]; abort, if given, is polled now and then and stops the
+    search when it returns true
+    Returns the search function
+    """
+    goal = list(range(len(tiles)))
+
+    def search(blank, g_cost, h_cost, last, bound):
+        """
+        Depth first search below the current node, cut off at bound
+        Returns FOUND, ABORTED or the smallest f cost beyond the bound
+        """
+        counter[0] += 1
+        f_cost = g_cost + h_cost
+        if f_cost > bound:
+            return f_cost
+        if h_cost == 0 and tiles == goal:
+            return FOUND
+        if abort is not None and counter[0] & 4095 == 0 and abort():
+            return ABORTED
+
+        minimum = None
+        skip = INVERSE_MOVES[last]
+        for direction, other in neighbours[blank]:
+            if direction == skip:
+                continue
+            tile = tiles[other]
+            tiles[blank] = tile
+            tiles[other] = 0
+            path.append(direction)
+            result = search(other, g_cost + 1,
+                            h_cost + delta(tiles, tile, other, blank),
+                            direction, bound)
+            if result == FOUND or result == ABORTED:
+                return result
+            path.pop()
+            tiles[other] = tile
+            tiles[blank] = 0
+            if minimum is None or result < minimum:
+                minimum = result
+        return minimum
+
+    return search
+
+
+def ida_star(puzzle, heuristic=None, stats=None):
+    """
+    Find a shortest solution for the puzzle with iterative deepening
+    A*, moving tiles in place on a single flat board
+    The puzzle itself is not changed; unsolvable puzzles raise
+    ValueError instead of searching forever
+    Returns a move string
+    """
+    if not puzzle.is_solvable():
+        raise ValueError("unsolvable puzzle:\n{}".format(puzzle))
+    height = puzzle.get_height()
+    width = puzzle.get_width()
+    if heuristic is None:
+        heuristic = LinearConflictHeuristic(height, width)
+    if stats is None:
+        stats = SearchStats()
+
+    tiles = board_tiles(puzzle)
+    path = []
+    counter = [0]
+    search = _depth_first(tiles, neighbour_table(height, width),
+                          heuristic.delta, path, counter)
+
+    start_time = timeit.default_timer()
+    h_cost = heuristic.estimate(tiles)
+    bound = h_cost
+    while True:
+        stats.iterations += 1
+        stats.bound = bound
+        result = search(tiles.index(0), 0, h_cost, None, bound)
+        if result == FOUND:
+            break
+        assert result is not None, "no moves available"
+        bound = result
+    stats.nodes += counter[0]
+    stats.elapsed += timeit.default_timer() - start_time
+    return "".join(path)
+
+
+#####################################
+# Parallel IDA*
+#
+# The tree is cut split_depth plies below the root, and each bound
+# iteration hands the subtrees below the cut to a process pool, in
+# the order the serial search would visit them.  The lowest subtree
+# index that holds a solution wins, just as the serial search would
+# stop at the first, so the move string is the same.  That index is
+# shared between the workers:  subtrees after it are skipped or
+# abandoned part way.
+
+
+def _frontier(tiles, neighbours, delta, h_cost, split_depth):
+    """
+    Nodes split_depth plies below the root in serial search order,
+    each as (moves, tiles, blank, h cost, f costs of its ancestors);
+    None if a solution turns up above the cut
+    Returns a list
+    """
+    goal = list(range(len(tiles)))
+    nodes = []
+    path = []
+    ancestors = []
+
+    def expand(blank, h_cost, last):
+        """
+        Collect the nodes below this one, or return True when it is
+        the goal
+        """
+        if h_cost == 0 and tiles == goal:
+            return True
+        if len(path) == split_depth:
+            nodes.append(("".join(path), list(tiles), blank, h_cost,
+                          tuple(ancestors)))
+            return False
+        ancestors.append(len(path) + h_cost)
+        skip = INVERSE_MOVES[last]
+        for direction, other in neighbours[blank]:
+            if direction == skip:
+                continue
+            tile = tiles[other]
+            tiles[blank] = tile
+            tiles[other] = 0
+            path.append(direction)
+            found = expand(other, h_cost + delta(tiles, tile, other, blank),
+                           direction)
+            path.pop()
+            tiles[other] = tile
+            tiles[blank] = 0
+            if found:
+                return True
+        ancestors.pop()
+        return False
+
+    if expand(tiles.index(0), h_cost, None):
+        return None
+    return nodes
+
+
+# per process state of the pool workers
+_WORKER = {}
+
+
+def _init_worker(height, width, heuristic, best):
+    """
+    Pool initializer:  keep the tables and the shared best index
+    """
+    _WORKER["neighbours"] = neighbour_table(height, width)
+    _WORKER["delta"] = heuristic.delta
+    _WORKER["best"] = best
+
+
+def _search_subtree(task):
+    """
+    Search one frontier subtree under the bound
+    Returns (index, result, moves below the cut, nodes visited)
+    """
+    index, (moves, tiles, blank, h_cost, ancestors), bound = task
+    best = _WORKER["best"]
+    for f_cost in ancestors:
+        if f_cost > bound:
+            # the serial search is cut off above this node
+            return index, f_cost, "", 0
+    if best.value < index:
+        return index, ABORTED, "", 0
+
+    path = []
+    counter = [0]
+    search = _depth_first(tiles, _WORKER["neighbours"], _WORKER["delta"],
+                          path, counter, lambda: best.value < index)
+    result = search(blank, len(moves), h_cost, moves[-1:] or None, bound)
+    if result == FOUND:
+        with best.get_lock():
+            if index < best.value:
+                best.value = index
+    return index, result, "".join(path), counter[0]
+
+
+def parallel_ida_star(puzzle, heuristic=None, stats=None, workers=None,
+                      split_depth=6):
+    """
+    ida_star spread over a process pool of workers (default one per
+    CPU, 1 searches in this process), returning the same move string
+    heuristic has to be picklable; a split_depth of 6 gives a few
+    hundred subtrees per iteration on a 4x4 board
+    Returns a move string
+    """
+    if not puzzle.is_solvable():
+        raise ValueError("unsolvable puzzle:\n{}".format(puzzle))
+    height = puzzle.get_height()
+    width = puzzle.get_width()
+    if heuristic is None:
+        heuristic = LinearConflictHeuristic(height, width)
+    if stats is None:
+        stats = SearchStats()
+
+    tiles = board_tiles(puzzle)
+    h_cost = heuristic.estimate(tiles)
+    nodes = _frontier(tiles, neighbour_table(height, width), heuristic.delta,
+                      h_cost, split_depth)
+    if nodes is None:
+        # solved within split_depth moves, nothing worth sharing out
+        return ida_star(puzzle, heuristic, stats)
+
+    start_time = timeit.default_timer()
+    best = multiprocessing.Value("i", len(nodes))
+    initargs = (height, width, heuristic, best)
+    pool = None
+    if workers == 1:
+        _init_worker(*initargs)
+        run = lambda tasks: map(_search_subtree, tasks)
+    else:
+        pool = multiprocessing.Pool(workers, _init_worker, initargs)
+        run = lambda tasks: pool.imap_unordered(_search_subtree, tasks)
+
+    try:
+        bound = h_cost
+        while True:
+            stats.iterations += 1
+            stats.bound = bound
+            best.value = len(nodes)
+            found = {}
+            minimum = None
+            for index, result, moves, count in run(
+                    [(index, node, bound) for index, node in enumerate(nodes)]):
+                stats.nodes += count
+                if result == FOUND:
+                    found[index] = moves
+                elif result != ABORTED and result is not None:
+                    if minimum is None or result < minimum:
+                        minimum = result
+            if found:
+                index = min(found)
+                break
+            assert minimum is not None, "no moves available"
+            bound = minimum
+    finally:
+        if pool is not None:
+            pool.terminate()
+    stats.elapsed += timeit.default_timer() - start_time
+    return nodes[index][0] + found[index]
+
+
+#####################################
+# Anytime weighted A*
+
+# largest board searched; beyond this only the incumbent is returned
+ANYTIME_MAX_CELLS = 256
+
+
+def _manhattan_bound(tiles, width):
+    """
+    Sum of the Manhattan distances of the tiles, without the tables
+    ManhattanHeuristic builds, for boards too big to search
+    Returns an integer
+    """
+    total = 0
+    for cell, tile in enumerate(tiles):
+        if tile:
+            row, col = divmod(cell, width)
+            goal_row, goal_col = divmod(tile, width)
+            total += abs(row - goal_row) + abs(col - goal_col)
+    return total
+
+
+def anytime_search(puzzle, deadline_ms=100, max_nodes=500000, weight=3.0,
+                   heuristic=None, stats=None):
+    """
+    Improve on the phase solver's solution with weighted A* until
+    deadline_ms milliseconds have passed, max_nodes states are stored
+    or the best solution is proven optimal
+
+    The phase solution (with optimize) is the first incumbent.  Nodes
+    are expanded by g + weight * h, and any node whose g + h cannot
+    beat the incumbent is dropped, so each goal reached is shorter.
+    At the end the smallest g + h left open is a lower bound on the
+    optimal length; stats, an AnytimeStats, gets it and the gap
+    The puzzle itself is not changed; unsolvable puzzles raise
+    ValueError
+    Returns a move string
+    """
+    if not puzzle.is_solvable():
+        raise ValueError("unsolvable puzzle:\n{}".format(puzzle))
+    if stats is None:
+        stats = AnytimeStats()
+    start_time = timeit.default_timer()
+    deadline = start_time + deadline_ms / 1000.0
+    height = puzzle.get_height()
+    width = puzzle.get_width()
+    best = puzzle.clone().solve_puzzle(optimize=True)
+    tiles = board_tiles(puzzle)
+
+    if len(tiles) > ANYTIME_MAX_CELLS:
+        lower_bound = _manhattan_bound(tiles, width)
+    else:
+        if heuristic is None:
+            heuristic = LinearConflictHeuristic(height, width)
+        delta = heuristic.delta
+        neighbours = neighbour_table(height, width)
+        goal = bytes(bytearray(range(len(tiles))))
+        start = bytes(bytearray(tiles))
+        h_cost = heuristic.estimate(tiles)
+        # smallest g + h of the children dropped for lack of room
+        dropped = len(best)
+        # state -> (g cost, parent state, move); open entries are
+        # (weighted f, -g, h, blank, state)
+        parents = {start: (0, None, None)}
+        open_list = [(weight * h_cost, 0, h_cost, tiles.index(0), start)]
+        nodes = 0
+        while open_list:
+            if nodes & 255 == 0 and timeit.default_timer() > deadline:
+                break
+            dummy, g_cost, h_cost, blank, state = heapq.heappop(open_list)
+            g_cost = -g_cost
+            if parents[state][0] < g_cost:
+                # reached again more cheaply since it was pushed
+                continue
+            if g_cost + h_cost >= len(best):
+                continue
+            nodes += 1
+            if h_cost == 0 and state == goal:
+                path = []
+                while parents[state][1] is not None:
+                    state, direction = parents[state][1:]
+                    path.append(direction)
+                best = "".join(reversed(path))
+                stats.improvements += 1
+                continue
+
+            board = bytearray(state)
+            for direction, other in neighbours[blank]:
+                tile = board[other]
+                board[blank] = tile
+                board[other] = 0
+                child = bytes(board)
+                child_h = h_cost + delta(board, tile, other, blank)
+                board[other] = tile
+                board[blank] = 0
+                child_g = g_cost + 1
+                if child_g + child_h >= len(best):
+                    continue
+                if child in parents and parents[child][0] <= child_g:
+                    continue
+                if child not in parents and len(parents) >= max_nodes:
+                    dropped = min(dropped, child_g + child_h)
+                    continue
+                parents[child] = (child_g, state, direction)
+                heapq.heappush(open_list, (child_g + weight * child_h,
+                                           -child_g, child_h, other, child))
+        stats.nodes += nodes
+        # every shorter solution passes through a node still open or
+        # one that was dropped
+        lower_bound = min([-g_cost + h_cost for dummy, g_cost, h_cost,
+                           dummy2, dummy3 in open_list] + [dropped])
+        lower_bound = max(lower_bound, heuristic.estimate(tiles))
+
+    lower_bound = min(lower_bound, len(best))
+    # all solutions of a board have the same parity
+    if (len(best) - lower_bound) % 2:
+        lower_bound += 1
+    stats.iterations += 1
+    stats.bound = lower_bound
+    stats.lower_bound = lower_bound
+    stats.solution_length = len(best)
+    stats.elapsed += timeit.default_timer() - start_time
+    return best
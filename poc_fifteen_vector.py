@@ -0,0 +1,177 @@
+"""
+NumPy batch engine for the Fifteen puzzle
+
+Holds N boards of one shape as an (N, height * width) array plus the
+flat index of each blank, and applies moves to all of them at once.
+Moves use the Puzzle.update_puzzle alphabet.  Instead of failing on a
+move off the grid, a board is marked invalid and left as it was
+before its first bad move.
+"""
+
+import numpy as np
+
+import poc_fifteen
+
+# padding in (N, L) move arrays:  no move for that board
+PAD = 0
+
+_DIRECTIONS = {"u": (-1, 0), "d": (1, 0), "l": (0, -1), "r": (0, 1)}
+
+# per character code:  row step, column step, known move
+_ROW_STEP = np.zeros(256, dtype=np.intp)
+_COL_STEP = np.zeros(256, dtype=np.intp)
+_KNOWN = np.zeros(256, dtype=bool)
+_KNOWN[PAD] = True
+for _direction, (_row_step, _col_step) in _DIRECTIONS.items():
+    _ROW_STEP[ord(_direction)] = _row_step
+    _COL_STEP[ord(_direction)] = _col_step
+    _KNOWN[ord(_direction)] = True
+
+
+def encode_moves(move_strings):
+    """
+    Pack move strings into an (N, L) uint8 array of character codes,
+    padding shorter strings with PAD
+    Returns a NumPy array
+    """
+    length = max([len(moves) for moves in move_strings] + [0])
+    codes = np.full((len(move_strings), length), PAD, dtype=np.uint8)
+    for number, moves in enumerate(move_strings):
+        codes[number, :len(moves)] = np.frombuffer(moves.encode("ascii"),
+                                                   dtype=np.uint8)
+    return codes
+
+
+def first_invalid_moves(height, width, blanks, moves):
+    """
+    Vectorised poc_fifteen.first_invalid_moves:  blanks holds the flat
+    blank index for each string, moves is a padded (N, L) array of
+    character codes or a list of N move strings; no board is needed
+    Returns an array of the first illegal move index per string, -1
+    where every move is legal
+    """
+    if not isinstance(moves, np.ndarray):
+        moves = encode_moves(moves)
+    rows, cols = np.divmod(np.asarray(blanks, dtype=np.intp), width)
+    rows = rows[:, None] + np.cumsum(_ROW_STEP[moves], axis=1)
+    cols = cols[:, None] + np.cumsum(_COL_STEP[moves], axis=1)
+    illegal = (~_KNOWN[moves] | (rows < 0) | (rows >= height) |
+               (cols < 0) | (cols >= width))
+    illegal[moves == PAD] = False
+    if not moves.shape[1]:
+        # argmax has nothing to look at when every string is empty
+        return np.full(len(moves), -1, dtype=np.intp)
+    first = np.argmax(illegal, axis=1)
+    return np.where(illegal.any(axis=1), first, -1)
+
+
+class BoardBatch(object):
+    """
+    A batch of boards of one shape, updated together
+    """
+
+    def __init__(self, height, width, tiles):
+        """
+        Wrap an (N, height * width) array-like of row-major tiles
+        """
+        dtype = np.dtype(poc_fifteen._typecode(height * width))
+        self._height = height
+        self._width = width
+        self._tiles = np.array(tiles, dtype=dtype, ndmin=2)
+        assert self._tiles.shape[1] == height * width, "wrong board size"
+        self._blanks = np.argmin(self._tiles, axis=1).astype(np.intp)
+        self._valid = np.ones(len(self._tiles), dtype=bool)
+
+    @classmethod
+    def from_puzzles(cls, puzzles):
+        """
+        Batch up a list of Puzzle objects of the same shape
+        Returns a BoardBatch
+        """
+        height = puzzles[0].get_height()
+        width = puzzles[0].get_width()
+        tiles = np.empty((len(puzzles), height * width),
+                         dtype=np.dtype(poc_fifteen._typecode(height * width)))
+        for number, puzzle in enumerate(puzzles):
+            assert (puzzle.get_height(), puzzle.get_width()) == (height, width)
+            tiles[number] = puzzle._cells
+        return cls(height, width, tiles)
+
+    def __len__(self):
+        """
+        Number of boards in the batch
+        """
+        return len(self._tiles)
+
+    def get_tiles(self):
+        """
+        Returns the (N, height * width) tile array (not a copy)
+        """
+        return self._tiles
+
+    def get_blanks(self):
+        """
+        Returns the flat blank index of every board
+        """
+        return self._blanks
+
+    def get_valid(self):
+        """
+        Returns the mask of boards that have only seen legal moves
+        """
+        return self._valid
+
+    def to_puzzles(self):
+        """
+        Returns a list of Puzzle objects, one per board
+        """
+        height, width = self._height, self._width
+        return [poc_fifteen.Puzzle(height, width,
+                                   board.reshape(height, width).tolist())
+                for board in self._tiles]
+
+    def apply(self, codes):
+        """
+        Apply one move to every board:  codes is a character code
+        (or move character) for all boards or one code per board
+        Returns the validity mask
+        """
+        if isinstance(codes, str):
+            codes = ord(codes)
+        codes = np.broadcast_to(np.asarray(codes, dtype=np.uint8),
+                                self._blanks.shape)
+        rows, cols = np.divmod(self._blanks, self._width)
+        rows = rows + _ROW_STEP[codes]
+        cols = cols + _COL_STEP[codes]
+        legal = (_KNOWN[codes] &
+                 (rows >= 0) & (rows < self._height) &
+                 (cols >= 0) & (cols < self._width))
+        self._valid &= legal
+
+        boards = np.flatnonzero(self._valid & (codes != PAD))
+        blanks = self._blanks[boards]
+        targets = rows[boards] * self._width + cols[boards]
+        self._tiles[boards, blanks] = self._tiles[boards, targets]
+        self._tiles[boards, targets] = 0
+        self._blanks[boards] = targets
+        return self._valid
+
+    def apply_moves(self, moves):
+        """
+        Apply a padded (N, L) array of character codes, or a list of
+        N move strings, one column of moves at a time
+        Returns the validity mask
+        """
+        if not isinstance(moves, np.ndarray):
+            moves = encode_moves(moves)
+        assert moves.shape[0] == len(self), "need one move row per board"
+        for column in moves.T:
+            self.apply(column)
+        return self._valid
+
+    def solved(self):
+        """
+        Returns a mask of the boards in the solved configuration
+        """
+        goal = np.arange(self._height * self._width, dtype=self._tiles.dtype)
+        return np.all(self._tiles == goal, axis=1)
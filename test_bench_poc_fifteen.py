@@ -0,0 +1,43 @@
+import bench_poc_fifteen as bench
+
+
+def test_instances():
+
+    first = bench.instances(4, 4, 5, seed=1)
+    second = bench.instances(4, 4, 5, seed=1)
+    assert first == second
+    assert all(board.is_solvable() for board in first)
+    assert bench.instances(4, 4, 5, seed=2) != first
+
+def test_bench_size():
+
+    metrics = bench.bench_size(4, 4, 3)
+    assert metrics["instances"] == 3
+    assert metrics["mean_moves"] > 0 and metrics["solves_per_sec"] > 0
+    assert "solve_interior_tile" in metrics["phase_ms"]
+    assert metrics["calls_per_solve"]["update_puzzle"] > 0
+
+def test_compare():
+
+    baseline = {"4x4": {"us_per_move": 1.0, "mean_moves": 100.0,
+                        "peak_kib": 1.0, "solves_per_sec": 1000.0}}
+    results = {"4x4": {"us_per_move": 1.05, "mean_moves": 120.0,
+                       "peak_kib": 1.0, "solves_per_sec": 800.0},
+               "5x5": {"us_per_move": 9.0, "mean_moves": 1.0,
+                       "peak_kib": 1.0, "solves_per_sec": 1.0}}
+    regressions = bench.compare(results, baseline, 0.1)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("4x4 mean_moves")
+
+def test_bench_scaling():
+
+    metrics = bench.bench_scaling(20, 20, move_budget=1000)
+    assert metrics["moves"] >= 1000
+    assert metrics["us_per_move"] > 0 and metrics["bytes_per_cell"] > 0
+    assert 0 < metrics["coverage"] <= 1
+
+def test_bench_parallel():
+
+    results = bench.bench_parallel(3, 3, 2, max_workers=2)
+    assert sorted(results) == ["1", "2"]
+    assert results["1"]["speedup"] == 1.0
@@ -190,3 +190,480 @@ def test_solve_problem():
     puz = fif.Puzzle(4, 4, grid)
     puz.solve_puzzle()
     assert puz.nrow_by_mcol_check(3,3) 
+
+
+def test_current_position_index():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    puz = fif.Puzzle(4, 4, grid)
+    assert puz.current_position(0, 0) == (3, 1)
+    assert puz.current_position(1, 2) == (0, 3)
+
+    # index follows moves, clones and set_number
+    puz.update_puzzle("uur")
+    assert puz.current_position(0, 0) == (1, 2)
+    assert puz.current_position(2, 1) == (2, 1)
+    assert puz.current_position(0, 2) == (1, 1)
+
+    clone = puz.clone()
+    clone.update_puzzle("l")
+    assert puz.current_position(0, 0) == (1, 2)
+    assert clone.current_position(0, 0) == (1, 1)
+
+    puz.set_number(0, 0, 11)
+    puz.set_number(3, 3, 1)
+    assert puz.current_position(2, 3) == (0, 0)
+    assert puz.current_position(0, 1) == (3, 3)
+
+def test_clone_equality_and_hash():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    puz = fif.Puzzle(4, 4, grid)
+    clone = puz.clone()
+    assert clone == puz and hash(clone) == hash(puz)
+    assert clone == fif.Puzzle(4, 4, grid)
+
+    clone.update_puzzle("u")
+    assert clone != puz
+    assert puz.get_number(3, 1) == 0 and clone.get_number(3, 1) == 13
+    clone.update_puzzle("d")
+    assert clone == puz and hash(clone) == hash(puz)
+
+    # same tiles in a different shape are a different puzzle
+    assert fif.Puzzle(2, 3) != fif.Puzzle(3, 2)
+
+def test_large_board_storage():
+
+    # boards over 256 cells need wider tiles
+    puz = fif.Puzzle(20, 20)
+    puz.update_puzzle("d" * 19 + "r" * 19)
+    assert puz.get_number(19, 19) == 0
+    assert puz.get_number(0, 0) == 20
+    assert puz.current_position(19, 19) == (19, 18)
+
+    # big boards keep their Zobrist keys in arrays
+    tile_keys, cell_keys = fif._zobrist_keys(300 * 300)
+    assert tile_keys.typecode == "Q" and len(cell_keys) == 300 * 300
+
+def test_solve_optimal():
+
+    grid = [[1,2,5],
+            [3,4,0],
+            [6,7,8]]
+
+    puz = fif.Puzzle(3, 3, grid)
+    moves = puz.solve_optimal()
+    assert moves == "ull"
+    assert puz.nrow_by_mcol_check(3, 3)
+
+def test_solve_many():
+
+    grids = [[[1,3,7,6],
+              [4,9,2,10],
+              [8,13,14,5],
+              [12,0,15,11]],
+             [[1,2,5],
+              [3,4,0],
+              [6,7,8]]]
+    boards = grids + [fif.Puzzle(4, 4, grids[0])]
+
+    for workers in (1, 2):
+        results = dict(fif.solve_many(boards, workers=workers, chunksize=1))
+        assert sorted(results) == [0, 1, 2]
+        assert results[0] == results[2] == fif.Puzzle(4, 4, grids[0]).solve_puzzle()
+        puz = fif.Puzzle(3, 3, grids[1])
+        puz.update_puzzle(results[1])
+        assert puz == fif.Puzzle(3, 3)
+
+    results = dict(fif.solve_many(grids[1:], workers=1, mode="optimal"))
+    assert results == {0: "ull"}
+
+def test_optimize_moves():
+
+    assert fif.optimize_moves("") == ""
+    assert fif.optimize_moves("udlr") == ""
+    assert fif.optimize_moves("ruldurdl") == ""
+    assert fif.optimize_moves("rrdlrul") == "r"
+    assert fif.optimize_moves("ruldrdlu") == "ruldrdlu"
+
+def test_solve_puzzle_optimize():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    moves = fif.Puzzle(4, 4, grid).solve_puzzle()
+    puz = fif.Puzzle(4, 4, grid)
+    short = puz.solve_puzzle(optimize=True)
+    assert short == fif.optimize_moves(moves)
+    assert len(short) < len(moves)
+    assert puz == fif.Puzzle(4, 4)
+
+def test_solve_puzzle_optimize_check(monkeypatch):
+
+    # a shortened string that no longer solves the board is rejected,
+    # with or without python -O
+    monkeypatch.setattr(fif, "optimize_moves", lambda moves: moves[:-1])
+    try:
+        fif.Puzzle(3, 3, [[1,2,5],[3,4,0],[6,7,8]]).solve_puzzle(optimize=True)
+        raised = False
+    except AssertionError:
+        raised = True
+    assert raised, "broken optimized moves should be rejected"
+
+def test_is_solvable():
+
+    assert fif.Puzzle(4, 4).is_solvable()
+    assert fif.Puzzle(3, 5).is_solvable()
+
+    # swapping two tiles flips solvability
+    grid = [[0,2,1],
+            [3,4,5],
+            [6,7,8]]
+    assert not fif.Puzzle(3, 3, grid).is_solvable()
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+    puz = fif.Puzzle(4, 4, grid)
+    assert puz.is_solvable()
+    puz.update_puzzle("uurrd")
+    assert puz.is_solvable()
+    puz.set_number(0, 0, 3)
+    puz.set_number(0, 1, 1)
+    assert not puz.is_solvable()
+
+    try:
+        puz.solve_puzzle()
+        assert False, "unsolvable puzzle should be rejected"
+    except ValueError:
+        pass
+    try:
+        list(fif.solve_many([fif.Puzzle(4, 4), puz], workers=1))
+        assert False, "unsolvable batch should be rejected"
+    except ValueError:
+        pass
+
+def test_encode_decode():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    puz = fif.Puzzle(4, 4, grid)
+    key = puz.encode()
+    assert key < 1 << 64
+    assert key & 0xff == 0x31
+    assert fif.Puzzle.decode(4, 4, key) == puz
+
+    for height, width in ((2, 3), (5, 5), (20, 20), (17, 17), (300, 300)):
+        puz = fif.Puzzle(height, width)
+        puz.update_puzzle("d" * (height - 1) + "r" * (width - 1) + "u")
+        assert fif.Puzzle.decode(height, width, puz.encode()) == puz
+
+def test_zobrist_hash():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    puz = fif.Puzzle(4, 4, grid)
+    start = puz.get_zobrist()
+    puz.update_puzzle("uurrd")
+    assert puz.get_zobrist() != start
+    # incremental updates agree with hashing from scratch
+    assert puz.get_zobrist() == fif.Puzzle.decode(4, 4, puz.encode()).get_zobrist()
+    puz.update_puzzle("ulldd")
+    assert puz.get_zobrist() == start
+
+    puz.set_number(0, 0, 3)
+    puz.set_number(0, 1, 1)
+    assert puz.get_zobrist() == fif.Puzzle.decode(4, 4, puz.encode()).get_zobrist()
+
+    # a move off the grid still leaves the hash consistent
+    puz = fif.Puzzle(3, 3)
+    try:
+        puz.update_puzzle("dru")
+    except AssertionError:
+        pass
+    assert puz.get_zobrist() == fif.Puzzle.decode(3, 3, puz.encode()).get_zobrist()
+
+    # so does an unknown direction, with or without python -O
+    for moves in ("rx", "x"):
+        puz = fif.Puzzle(3, 3)
+        try:
+            puz.update_puzzle(moves)
+            raised = False
+        except AssertionError:
+            raised = True
+        assert raised, "invalid direction should be rejected"
+        rebuilt = fif.Puzzle._from_cells(3, 3, puz._cells[:])
+        assert puz._positions == rebuilt._positions
+        assert puz.get_zobrist() == rebuilt.get_zobrist()
+        assert puz._correct == rebuilt._correct
+        assert puz._first_solved_row == rebuilt._first_solved_row
+
+def test_solve_endgame():
+
+    grid = [[4,1,2,3],
+            [5,0,6,7],
+            [8,9,10,11]]
+
+    puz = fif.Puzzle(3, 4, grid)
+    assert puz.solve_endgame(2, 3) == "lu"
+    assert puz == fif.Puzzle(3, 4)
+
+def test_solve_narrow_boards():
+
+    # 3 wide boards finish with the 3x3 table, 2 wide with the 2x2
+    for height, width in ((3, 3), (6, 3), (2, 3), (2, 5), (5, 2)):
+        puz = fif.Puzzle(height, width)
+        shuffled, moves = shuffle_puzzle(puz, 500)
+        shuffled.solve_puzzle()
+        assert shuffled == puz, (height, width)
+
+    # boards the table covers whole are solved in the fewest moves
+    for height, width in ((3, 3), (2, 3)):
+        for puz in fif.random_puzzles(height, width, 10, seed=3):
+            length = len(puz.clone().solve_optimal())
+            assert len(puz.solve_puzzle()) == length
+            assert puz == fif.Puzzle(height, width)
+
+def test_instrument():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    puz = fif.Puzzle(4, 4, grid)
+    with puz.instrument() as stats:
+        moves = puz.solve_puzzle()
+
+    counters = stats.as_dict()
+    phases = counters["phases"]
+    assert phases["solve_interior_tile"]["calls"] == 6
+    assert phases["solve_col0_tile"]["calls"] == 2
+    assert phases["solve_endgame"]["calls"] == 1
+    assert sum(phase["moves"] for phase in phases.values()) == len(moves)
+    assert phases["invariants"]["moves"] == 0
+    assert counters["calls"]["update_puzzle"] > 0
+    assert counters["calls"]["current_position"] > 0
+
+    # nothing is recorded outside the with block
+    puz.update_puzzle("d")
+    assert stats.calls["update_puzzle"] == counters["calls"]["update_puzzle"]
+
+def test_iter_solve():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    moves = fif.Puzzle(4, 4, grid).solve_puzzle()
+
+    puz = fif.Puzzle(4, 4, grid)
+    chunks = puz.iter_solve()
+    first = next(chunks)
+    # the board is updated as chunks are produced
+    replay = fif.Puzzle(4, 4, grid)
+    replay.update_puzzle(first)
+    assert replay == puz
+
+    assert first + "".join(chunks) == moves
+    assert puz == fif.Puzzle(4, 4)
+
+    # unsolvable boards are rejected before iteration starts
+    try:
+        fif.Puzzle(2, 2, [[0, 2], [1, 3]]).iter_solve()
+        assert False, "unsolvable puzzle should be rejected"
+    except ValueError:
+        pass
+
+def test_position_macro():
+
+    # tile two left of and one above the zero tile at its destination:
+    # coming along the row pushes it one right
+    moves, czt, ctt = fif._position_macro((0, 0), (-1, -2), False)
+    assert moves == "u" + "ll" + "urrdl" + "druld"
+    assert czt == (0, -1) and ctt == (0, 0)
+    # the same relative layout is served from the table
+    assert fif._position_macro((0, 0), (-1, -2), False)[0] is moves
+
+    # zero tile directly below the tile pushes it down first
+    moves, czt, ctt = fif._position_macro((0, 0), (-2, 0), False)
+    assert moves == "uu" + "ld" + "druld"
+
+    grid = [[1,2,8],
+            [4,5,3],
+            [6,7,0]]
+    puz = fif.Puzzle(3, 3, grid)
+    assert puz.solve_interior_tile(2, 2) == "uu" + "ld" + "druld"
+
+def test_solve_shuffled_boards():
+
+    for height, width in ((4, 4), (5, 3), (2, 5), (7, 9)):
+        tiles = list(range(height * width))
+        random.Random(height * width).shuffle(tiles)
+        grid = [tiles[row * width:(row + 1) * width] for row in range(height)]
+        puz = fif.Puzzle(height, width, grid)
+        if not puz.is_solvable():
+            continue
+        moves = puz.clone().solve_puzzle()
+        puz.update_puzzle(moves)
+        assert puz == fif.Puzzle(height, width)
+
+def test_random_puzzles():
+
+    first = list(fif.random_puzzles(4, 4, 50, seed=3))
+    assert first == list(fif.random_puzzles(4, 4, 50, seed=3))
+    assert first != list(fif.random_puzzles(4, 4, 50, seed=4))
+    assert all(puz.is_solvable() for puz in first)
+    assert len(set(first)) == 50
+
+    # every one of the 360 solvable 2x3 boards turns up
+    boards = set(puz.encode() for puz in fif.random_puzzles(2, 3, 5000, seed=5))
+    assert len(boards) == 360
+
+    puz = fif.random_puzzle(3, 5, random.Random(6))
+    assert sorted(puz._cells) == list(range(15))
+    assert puz.current_position(0, 0) == divmod(puz._cells.index(0), 5)
+
+def test_move_permutation():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    moves = fif.Puzzle(4, 4, grid).solve_puzzle()
+    puz = fif.Puzzle(4, 4, grid)
+    perm = fif.compile_moves(puz, moves)
+    assert len(perm) == len(moves) and perm.get_end() == (0, 0)
+    perm.apply(puz)
+    assert puz == fif.Puzzle(4, 4)
+    assert hash(puz) == hash(fif.Puzzle(4, 4))
+
+    # undo in two chunks
+    half = len(moves) // 2
+    first = fif.compile_moves(fif.Puzzle(4, 4, grid), moves[:half])
+    second = fif.MovePermutation.compile(4, 4, first.get_end(), moves[half:])
+    assert first.then(second) == perm
+    second.inverse().apply(puz)
+    first.inverse().apply(puz)
+    assert puz == fif.Puzzle(4, 4, grid)
+
+    # moves are checked when compiling, positions when applying
+    try:
+        fif.MovePermutation.compile(4, 4, (0, 0), "rrdlu")
+        fif.MovePermutation.compile(4, 4, (0, 0), "rrul")
+        assert False, "move off grid should be rejected"
+    except ValueError:
+        pass
+    try:
+        first.apply(fif.Puzzle(4, 4))
+        assert False, "wrong start should be rejected"
+    except ValueError:
+        pass
+
+def test_first_invalid_move():
+
+    assert fif.first_invalid_move(3, 4, (0, 0), "rrrddlll") == -1
+    assert fif.first_invalid_move(3, 4, (0, 0), "rrrr") == 3
+    assert fif.first_invalid_move(3, 4, (2, 3), "uulx") == 3
+    assert fif.first_invalid_move(3, 4, (2, 3), "") == -1
+
+    # nothing is touched on the way
+    puz = fif.Puzzle(3, 4)
+    assert fif.first_invalid_move(3, 4, puz.current_position(0, 0), "duu") == 2
+    assert puz == fif.Puzzle(3, 4)
+
+    assert fif.first_invalid_moves(3, 4, None, ["dd", "ddd", "u"],
+                                   zero_position=(0, 0)) == [-1, 2, 0]
+    assert fif.first_invalid_moves(3, 4, [(0, 0), (2, 0)], ["d", "d"]) == [-1, 0]
+    assert fif.first_invalid_moves(3, 4, ((0, 0), (2, 0)), ["d", "d"]) == [-1, 0]
+    # any pairs will do as positions, not only tuples
+    assert fif.first_invalid_moves(3, 4, [[0, 0], [2, 0]], ["d", "d"]) == [-1, 0]
+
+def test_transposed():
+
+    grid = [[1,2,3],
+            [0,4,5]]
+
+    puz = fif.Puzzle(2, 3, grid)
+    # tile 4 (goal (1, 1)) stays tile 4 (goal (1, 1)) of a 3x2 board,
+    # tile 1 (goal (0, 1)) becomes tile 2 (goal (1, 0))
+    assert puz.transposed() == fif.Puzzle(3, 2, [[2,0],
+                                                 [4,3],
+                                                 [1,5]])
+    assert puz.transposed().transposed() == puz
+    assert fif.Puzzle(3, 5).transposed() == fif.Puzzle(5, 3)
+
+    # a solution of the transpose solves the original, moves swapped
+    moves = "".join(map(fif.TRANSPOSED_MOVES.get,
+                        puz.transposed().solve_puzzle()))
+    puz.update_puzzle(moves)
+    assert puz == fif.Puzzle(2, 3)
+
+def test_solve_oriented():
+
+    for height, width in ((6, 2), (4, 4), (3, 7)):
+        for puz in fif.random_puzzles(height, width, 5, seed=2):
+            length = len(puz.clone().solve_puzzle(optimize=True))
+            # optimized lengths are compared, whatever the raw ones
+            transposed = len(puz.transposed().solve_puzzle(optimize=True))
+            moves = fif.SOLVE_MODES["oriented"](puz)
+            assert len(moves) == min(length, transposed)
+            assert puz == fif.Puzzle(height, width)
+
+def test_correct_counts():
+
+    def counts(puz):
+        return (puz._correct, puz._row_correct, puz._col_correct,
+                puz._first_solved_row)
+
+    puz = fif.random_puzzle(4, 5, random.Random(8))
+    shuffled, moves = shuffle_puzzle(puz, 300)
+    puz.update_puzzle(moves)
+    assert counts(puz) == counts(fif.Puzzle._from_cells(4, 5, puz._cells[:]))
+
+    # solved rows at the bottom come and go move by move
+    shuffled, moves = shuffle_puzzle(fif.Puzzle(5, 3), 200)
+    puz = fif.Puzzle(5, 3)
+    for direction in moves:
+        puz.update_puzzle(direction)
+        assert counts(puz) == counts(
+            fif.Puzzle._from_cells(5, 3, puz._cells[:]))
+    puz = fif.Puzzle(5, 3)
+    puz.update_puzzle("rrdddd")
+    assert puz._first_solved_row == 5
+    puz.update_puzzle("uuuull")
+    assert puz._first_solved_row == 1
+
+    puz = fif.Puzzle(3, 4)
+    assert counts(puz) == (11, [3, 4, 4], [2, 3, 3, 3], 1)
+    puz.set_number(2, 3, 10)
+    puz.set_number(2, 2, 11)
+    assert counts(puz) == (9, [3, 4, 2], [2, 3, 2, 2], 3)
+    assert puz.clone()._row_correct == [3, 4, 2]
+
+    # checks read from the counts
+    assert puz.nrow_by_mcol_check(2, 4)
+    assert puz.nrow_by_mcol_check(3, 2)
+    assert puz.nrow_by_mcol_check(2, 3)
+    assert not puz.nrow_by_mcol_check(3, 3)
+    assert not puz.nrow_by_mcol_check(3, 4)
+    assert puz.lower_row_invariant(0, 0) is False
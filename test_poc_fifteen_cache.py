@@ -0,0 +1,54 @@
+import poc_fifteen as fif
+import poc_fifteen_cache as cache
+
+
+def test_solve_cached():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    solutions = cache.SolutionCache()
+    puz = fif.Puzzle(4, 4, grid)
+    moves = solutions.solve(puz)
+    assert puz == fif.Puzzle(4, 4)
+    assert solutions.get_stats()["misses"] == 1
+
+    # a repeat is served from the cache and still solves the board
+    puz = fif.Puzzle(4, 4, grid)
+    assert solutions.solve(puz) == moves
+    assert puz == fif.Puzzle(4, 4)
+    assert solutions.get_stats()["hits"] == 1
+
+    # modes are cached separately
+    assert solutions.get(fif.Puzzle(4, 4, grid), "phase_optimized") is None
+
+def test_lru_eviction():
+
+    boards = list(fif.random_puzzles(3, 3, 3, seed=1))
+    key_size = len(cache.SolutionCache.key(boards[0]))
+    solutions = cache.SolutionCache(max_bytes=2 * (key_size + 4))
+    solutions.put(boards[0], "phase", "rrrr")
+    solutions.put(boards[1], "phase", "dddd")
+    # touch the first board, so the second is the oldest
+    assert solutions.get(boards[0]) == "rrrr"
+    solutions.put(boards[2], "phase", "llll")
+    assert len(solutions) == 2
+    assert solutions.get(boards[1]) is None
+    assert solutions.get(boards[0]) == "rrrr"
+    assert solutions.get_stats()["bytes"] <= 2 * (key_size + 4)
+
+def test_persistence(tmp_path):
+
+    path = str(tmp_path / "solutions.sqlite")
+    board = fif.random_puzzle(4, 4)
+    solutions = cache.SolutionCache(path=path)
+    moves = solutions.solve(board.clone())
+    solutions.close()
+
+    solutions = cache.SolutionCache(path=path)
+    assert solutions.get(board) == moves
+    stats = solutions.get_stats()
+    assert stats["hits"] == stats["disk_hits"] == 1
+    solutions.close()
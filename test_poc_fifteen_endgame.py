@@ -0,0 +1,59 @@
+import poc_fifteen as fif
+import poc_fifteen_endgame as endgame
+
+
+def test_solve_region_2x3():
+
+    grid = [[3,1,2],
+            [4,0,5]]
+
+    puz = fif.Puzzle(2, 3, grid)
+    assert endgame.solve_region(puz, 2, 3) == "lu"
+    # the puzzle is left alone
+    assert puz.get_number(1, 1) == 0
+
+def test_solve_region_3x3():
+
+    # only the upper left 3x3 of a 4x3 board is out of place
+    grid = [[3,1,2],
+            [4,7,5],
+            [0,6,8],
+            [9,10,11]]
+
+    puz = fif.Puzzle(4, 3, grid)
+    assert endgame.solve_region(puz, 3, 3) == "rulu"
+
+    # tables match optimal search on the 3x3 board itself
+    grid = [[8,6,7],
+            [2,5,4],
+            [3,0,1]]
+
+    puz = fif.Puzzle(3, 3, grid)
+    assert len(endgame.solve_region(puz, 3, 3)) == len(puz.clone().solve_optimal())
+
+def test_solve_region_2x3_in_wide_board():
+
+    grid = [[1,5,2,3],
+            [4,0,6,7],
+            [8,9,10,11]]
+
+    puz = fif.Puzzle(3, 4, grid)
+    moves = endgame.solve_region(puz, 2, 3)
+    puz.update_puzzle(moves)
+    assert moves == "ul" and puz == fif.Puzzle(3, 4)
+
+def test_distance_table_file(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(endgame, "TABLE_DIR", str(tmp_path / "tables"))
+    monkeypatch.setattr(endgame, "_TABLES", {})
+    table = endgame.distance_table(2, 3)
+    assert (tmp_path / "tables" / "endgame_2x3.bin").exists()
+    assert table.lookup((1, 2, 3, 4, 5)) == 0
+
+    # later processes map the saved file instead of building it
+    monkeypatch.setattr(endgame, "_TABLES", {})
+    loaded = endgame.distance_table(2, 3)
+    assert loaded is not table
+    assert loaded.lookup((1, 2, 3, 4, 5)) == 0
+    assert loaded.lookup((0, 2, 3, 4, 5)) == 1
+    loaded.close()
@@ -0,0 +1,75 @@
+import multiprocessing
+
+import poc_fifteen as fif
+import poc_fifteen_pdb as pdb
+import poc_fifteen_search as search
+
+
+def test_rank():
+
+    # every placement of 2 tiles on 4 cells gets its own index
+    indices = set(pdb.rank((first, second), 4)
+                  for first in range(4) for second in range(4)
+                  if first != second)
+    assert indices == set(range(pdb.table_size(4, 2)))
+
+def test_build_table():
+
+    database = pdb.PatternDatabase.build(2, 3, (1, 2))
+    assert database.lookup((1, 2)) == 0
+    # 2 slides down: one move of a pattern tile
+    assert database.lookup((1, 5)) == 1
+    # 1 slides down, the blank gets round via the free tiles
+    assert database.lookup((4, 2)) == 1
+
+def test_save_and_load(tmp_path):
+
+    database = pdb.PatternDatabase.build(3, 3, (1, 2, 3, 4))
+    path = str(tmp_path / "pdb.bin")
+    database.save(path)
+
+    loaded = pdb.PatternDatabase.load(path)
+    assert loaded.get_shape() == (3, 3)
+    assert loaded.get_pattern() == (1, 2, 3, 4)
+    for cells in ((1, 2, 3, 4), (8, 7, 6, 5), (0, 3, 6, 2)):
+        assert loaded.lookup(cells) == database.lookup(cells)
+    loaded.close()
+
+def test_pattern_database_heuristic():
+
+    heuristic = pdb.PatternDatabaseHeuristic(
+        [pdb.PatternDatabase.build(3, 3, (1, 2, 3, 4)),
+         pdb.PatternDatabase.build(3, 3, (5, 6, 7, 8))])
+
+    grid = [[3,1,2],
+            [4,7,5],
+            [0,6,8]]
+
+    puz = fif.Puzzle(3, 3, grid)
+    tiles = search.board_tiles(puz)
+    assert heuristic.estimate(tiles) <= 4
+    assert heuristic.estimate(list(range(9))) == 0
+
+    # incremental updates agree with full evaluations
+    before = heuristic.estimate(tiles)
+    tiles[6], tiles[7] = 6, 0
+    assert (heuristic.estimate(tiles) - before ==
+            heuristic.delta(tiles, 6, 7, 6))
+
+    assert puz.solve_optimal(heuristic) == "rulu"
+
+def test_loaded_database_in_spawn_pool(tmp_path):
+
+    path = str(tmp_path / "pdb.bin")
+    pdb.PatternDatabase.build(2, 3, (1, 2)).save(path)
+    heuristic = pdb.load_heuristic([path])
+    tiles = [0, 2, 1, 3, 4, 5]
+
+    # spawned workers get the file name and map it themselves
+    pool = multiprocessing.get_context("spawn").Pool(1)
+    try:
+        estimates = pool.map(heuristic.estimate, [tiles])
+        assert estimates == [heuristic.estimate(tiles)]
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,123 @@
+import poc_fifteen as fif
+import poc_fifteen_search as search
+
+
+def test_manhattan_heuristic():
+
+    grid = [[1,0,2],
+            [3,4,5],
+            [6,8,7]]
+
+    heuristic = search.ManhattanHeuristic(3, 3)
+    tiles = [tile for row in grid for tile in row]
+    assert heuristic.estimate(tiles) == 3
+    assert heuristic.estimate(list(range(9))) == 0
+
+def test_linear_conflict_heuristic():
+
+    # 8 and 7 swapped in their goal row: one conflict
+    grid = [[0,1,2],
+            [3,4,5],
+            [6,8,7]]
+
+    heuristic = search.LinearConflictHeuristic(3, 3)
+    tiles = [tile for row in grid for tile in row]
+    assert heuristic.estimate(tiles) == 2 + 2
+
+    # three tiles reversed in a row only need two to step aside
+    grid = [[0,1,2,3],
+            [4,5,6,7],
+            [8,9,10,11],
+            [12,15,14,13]]
+
+    heuristic = search.LinearConflictHeuristic(4, 4)
+    tiles = [tile for row in grid for tile in row]
+    assert heuristic.estimate(tiles) == 4 + 2 * 2
+
+def test_heuristic_delta():
+
+    grid = [[4,1,2],
+            [3,0,5],
+            [6,7,8]]
+
+    for heuristic in (search.ManhattanHeuristic(3, 3),
+                      search.LinearConflictHeuristic(3, 3)):
+        tiles = [tile for row in grid for tile in row]
+        for direction, other in search.neighbour_table(3, 3)[4]:
+            before = heuristic.estimate(tiles)
+            tile = tiles[other]
+            tiles[4], tiles[other] = tile, 0
+            assert (heuristic.estimate(tiles) - before ==
+                    heuristic.delta(tiles, tile, other, 4)), direction
+            tiles[4], tiles[other] = 0, tile
+
+def test_ida_star():
+
+    grid = [[3,1,2],
+            [4,7,5],
+            [0,6,8]]
+
+    puz = fif.Puzzle(3, 3, grid)
+    stats = search.SearchStats()
+    moves = search.ida_star(puz, stats=stats)
+    # the puzzle itself is left alone
+    assert puz.get_number(2, 0) == 0
+
+    assert moves == "rulu"
+    assert stats.nodes > 0 and stats.bound == 4
+    puz.update_puzzle(moves)
+    assert puz == fif.Puzzle(3, 3)
+
+def test_anytime_search():
+
+    # small boards are searched to the end:  the result is optimal
+    grid = [[8,6,7],
+            [2,5,4],
+            [3,0,1]]
+
+    puz = fif.Puzzle(3, 3, grid)
+    stats = search.AnytimeStats()
+    moves = search.anytime_search(puz, deadline_ms=10000, stats=stats)
+    assert len(moves) == len(puz.clone().solve_optimal())
+    assert stats.get_gap() == 0
+    assert puz == fif.Puzzle(3, 3, grid)
+
+    # a node cap stops the search early, never above the incumbent
+    puz = fif.random_puzzle(4, 4, fif.random.Random(3))
+    stats = search.AnytimeStats()
+    moves = search.anytime_search(puz, deadline_ms=10000, max_nodes=500,
+                                  stats=stats)
+    assert len(moves) <= len(puz.clone().solve_puzzle(optimize=True))
+    assert 0 < stats.lower_bound <= len(moves)
+    assert stats.get_gap() % 2 == 0
+    puz.update_puzzle(moves)
+    assert puz == fif.Puzzle(4, 4)
+
+def test_solve_anytime():
+
+    puz = fif.random_puzzle(5, 5, fif.random.Random(4))
+    phase_moves = puz.clone().solve_puzzle(optimize=True)
+    moves = fif.SOLVE_MODES["anytime"](puz)
+    assert len(moves) <= len(phase_moves)
+    assert puz == fif.Puzzle(5, 5)
+
+def test_parallel_ida_star():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    puz = fif.Puzzle(4, 4, grid)
+    moves = search.ida_star(puz)
+    # same string as the serial search, in process and with a pool
+    assert search.parallel_ida_star(puz, workers=1) == moves
+    assert search.parallel_ida_star(puz, workers=2, split_depth=3) == moves
+    assert puz == fif.Puzzle(4, 4, grid)
+
+    # solutions above the cut are found too
+    grid = [[1,0,2],
+            [3,4,5],
+            [6,7,8]]
+
+    assert search.parallel_ida_star(fif.Puzzle(3, 3, grid), workers=1) == "l"
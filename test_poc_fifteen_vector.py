@@ -0,0 +1,65 @@
+import pytest
+
+import poc_fifteen as fif
+
+np = pytest.importorskip("numpy")
+import poc_fifteen_vector as vector
+
+
+def test_apply_single_move():
+
+    grid = [[1,2,5],
+            [3,4,0],
+            [6,7,8]]
+
+    batch = vector.BoardBatch.from_puzzles([fif.Puzzle(3, 3, grid),
+                                            fif.Puzzle(3, 3)])
+    valid = batch.apply("u")
+    # the solved board has its blank in the top row
+    assert valid.tolist() == [True, False]
+    assert batch.get_blanks().tolist() == [2, 0]
+
+    puzzles = batch.to_puzzles()
+    expected = fif.Puzzle(3, 3, grid)
+    expected.update_puzzle("u")
+    assert puzzles[0] == expected
+    assert puzzles[1] == fif.Puzzle(3, 3)
+
+def test_apply_moves_matches_update_puzzle():
+
+    grid = [[1,3,7,6],
+            [4,9,2,10],
+            [8,13,14,5],
+            [12,0,15,11]]
+
+    move_strings = [fif.Puzzle(4, 4, grid).solve_puzzle(), "uu", "", "rrr", "ux"]
+    batch = vector.BoardBatch.from_puzzles([fif.Puzzle(4, 4, grid)] * 5)
+    valid = batch.apply_moves(move_strings)
+    assert valid.tolist() == [True, True, True, False, False]
+    assert batch.solved().tolist() == [True, False, False, False, False]
+
+    for puzzle, moves, ok in zip(batch.to_puzzles(), move_strings, valid):
+        if ok:
+            expected = fif.Puzzle(4, 4, grid)
+            expected.update_puzzle(moves)
+            assert puzzle == expected
+
+    # invalid boards stop just before their first bad move
+    expected = fif.Puzzle(4, 4, grid)
+    expected.update_puzzle("rr")
+    assert batch.to_puzzles()[3] == expected
+
+def test_encode_moves():
+
+    codes = vector.encode_moves(["ud", "l", ""])
+    assert codes.shape == (3, 2)
+    assert codes[1].tolist() == [ord("l"), vector.PAD]
+
+def test_first_invalid_moves():
+
+    strings = ["rrrddlll", "rrrr", "uulx", "", "dru"]
+    blanks = [0, 0, 11, 11, 0]
+    expected = [fif.first_invalid_move(3, 4, divmod(blank, 4), moves)
+                for blank, moves in zip(blanks, strings)]
+    assert vector.first_invalid_moves(3, 4, blanks, strings).tolist() == expected
+    assert vector.first_invalid_moves(3, 4, [0, 0], ["", ""]).tolist() == [-1, -1]